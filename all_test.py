@@ -3,10 +3,14 @@
 import testoob
 
 from bpg_test import BodyPartTest, BodyPartGraphTest
+from engine_test import EngineTest, SlotsTest
 from ev_test import EvTest
 from evolve_test import GenerationTest
 from network_test import NetworkTest
 from plot_test import PlotTest
+from rand_test import SampleTest
+from transfer_test import SigmoidTest, EkebergTest, SineTest
+from validate_test import ValidateTest
 from sim_test import BpgTestCase, BpgSimTestCase, PoleBalanceSimTestCase
 from test_common import test_main
 
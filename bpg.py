@@ -3,6 +3,7 @@
 import random
 import copy
 import math
+from cPickle import loads, dumps
 
 from persistent import Persistent
 from persistent.list import PersistentList
@@ -16,7 +17,9 @@ except ImportError:
     from cgtypes import vec3
 import network
 import node
-from rand import rnd, randomVec3, randomQuat, randomAxis
+import engine
+import validate
+from rand import rnd, sample, randomVec3, randomQuat, randomAxis
 MAX_UNROLLED_BODYPARTS = 20
 MIN_UNROLLED_BODYPARTS = 3
 
@@ -51,7 +54,7 @@ def unroll_bodypart_copy(bp_o, skipNetwork):
     if skipNetwork:
         bp_c.network = None
     else:
-        bp_c.network = copy.deepcopy(bp_o.network)
+        bp_c.network = bp_o.network.phenotype()
     bp_c.edges = PersistentList()
     bp_c.input_map = None
     bp_c.motor_input = PersistentList([None,None,None])
@@ -145,6 +148,11 @@ class BodyPart(Persistent):
         del self.input_map
         del self.motor_input
 
+    def clone(self):
+        """Return a copy of this bodypart and everything it links to, the same as
+        copy.deepcopy, see Network.clone"""
+        return loads(dumps(self, 2))
+
     def connectTo(self, child):
         "Make an edge from this bodypart to a child"
         log.debug('BodyPart.connectTo')
@@ -168,10 +176,10 @@ class BodyPart(Persistent):
                 setattr(self, k, None)
 
         mutations = 0
-        for attr in attrs:
-            if random.random() < p:
-                setattr(self, attr, eval(attrs[attr]))
-                mutations += 1
+        names = attrs.keys()
+        for i in sample(len(names), p):
+            setattr(self, names[i], eval(attrs[names[i]]))
+            mutations += 1
         # mutate control network
         if p:
             self.mutations += self.network.mutate(p)
@@ -209,12 +217,76 @@ class BodyPartGraph(Persistent):
             self.randomInit(network_args)
 
     def destroy(self):
+        self.dropEngine()
         for bp in self.bodyparts:
             bp.destroy()
 
-    def step(self):
+    def clone(self):
+        "Return a copy of this graph, the same as copy.deepcopy, see Network.clone"
+        return loads(dumps(self, 2))
+
+    def prune(self):
+        """Only step the nodes of an unrolled graph that can affect its motors:
+        walking back from the motor inputs, the nodes they read and, through
+        network inputs and external inputs, everything those depend on.
+        Async networks are left whole. Returns (stepped, total) node counts."""
+        assert self.unrolled
+        self.dropEngine()
+        live = set()
+        todo = [x[1] for bp in self.bodyparts for x in bp.motor_input if x]
+        while todo:
+            n = todo.pop()
+            if isinstance(n, node.Node) and n not in live:
+                live.add(n)
+                todo += n.inputs
+                todo += [src for (sbp, src) in n.externalInputs]
+        stepped = 0
+        total = 0
         for bp in self.bodyparts:
-            bp.network.step()
+            if bp.network.update_style == 'sync':
+                bp.network.prune(live)
+            stepped += len(bp.network.getLive())
+            total += len(bp.network)
+        return (stepped, total)
+
+    def getEngine(self):
+        """Return one engine for the networks of all bodyparts of an unrolled
+        graph, or None if they have to be stepped one network at a time. The
+        networks are joined block diagonally (see network.join), and the
+        links between them and from the sensors are external input columns,
+        since the sim sets them one value at a time with noise."""
+        if not hasattr(self, '_v_engine'):
+            self._v_engine = None
+            if self.unrolled and len(self.bodyparts) > 1:
+                j = network.join([bp.network for bp in self.bodyparts])
+                if j:
+                    # the nodes are only stepped by this engine from now on,
+                    # and it has to start from the state of the network engines
+                    for bp in self.bodyparts:
+                        bp.network.dropEngine()
+                    self._v_engine = engine.compile(j)
+        return self._v_engine
+
+    def dropEngine(self):
+        "Discard the engine, see Network.dropEngine"
+        if hasattr(self, '_v_engine'):
+            if self._v_engine:
+                self._v_engine.sync()
+                if self._v_engine.memo:
+                    self._v_engine.report()
+            del self._v_engine
+
+    def step(self):
+        e = self.getEngine()
+        if e:
+            e.step()
+        else:
+            for bp in self.bodyparts:
+                bp.network.step()
+        self.stepMotors()
+
+    def stepMotors(self):
+        "Move the motors towards their target angles"
         for bp in self.bodyparts:
             if hasattr(bp, 'motor'):
                 bp.motor.step()
@@ -470,6 +542,8 @@ class BodyPartGraph(Persistent):
     def sanityCheck(self):
         "See if anything is wrong with this BodyPartGraph"
         log.debug('BodyPartGraph.sanityCheck')
+        if not validate.on:
+            return
         # check everything we can reach from the root is in our bodypart list
         assert self.root in self.bodyparts
         bps = [self.root]
@@ -618,35 +692,34 @@ class BodyPartGraph(Persistent):
     def mutate_delete_edges(self, p):
         "Randomly erase edges in this BodyPartGraph with probability p"
         for bp in self.bodyparts:
-            for i in range(len(bp.edges)-1, -1, -1):
-                if random.random() < p:
-                    # delete edge
-                    log.debug('delete edge')
-                    self.mutations += 1
-                    del bp.edges[i]
-                    self.fixup()
-                    self.sanityCheck()
-
-    def mutate_add_edges(self, p):
-        "Randomly add edges in this BodyPartGraph with probability p"
-        for s_bp in self.bodyparts:
-            if random.random() < p:
-                #and len(self.bodyparts) < BPG_MAX_EDGES:
-                # add edge
-                log.debug('add edge')
+            for i in reversed(sample(len(bp.edges), p)):
+                # delete edge
+                log.debug('delete edge')
                 self.mutations += 1
-                t_bp = random.choice(self.bodyparts)
-                e = Edge(t_bp, random.choice([-1,1]), random.choice([0,1]))
-                s_bp.edges.append(e)
-                # we now have new nodes in the unrolled bpg which don't have
-                # entries in their genotype bp for their neighbours, so fixup
+                del bp.edges[i]
                 self.fixup()
                 self.sanityCheck()
 
+    def mutate_add_edges(self, p):
+        "Randomly add edges in this BodyPartGraph with probability p"
+        for i in sample(len(self.bodyparts), p):
+            s_bp = self.bodyparts[i]
+            #and len(self.bodyparts) < BPG_MAX_EDGES:
+            # add edge
+            log.debug('add edge')
+            self.mutations += 1
+            t_bp = random.choice(self.bodyparts)
+            e = Edge(t_bp, random.choice([-1,1]), random.choice([0,1]))
+            s_bp.edges.append(e)
+            # we now have new nodes in the unrolled bpg which don't have
+            # entries in their genotype bp for their neighbours, so fixup
+            self.fixup()
+            self.sanityCheck()
+
     def mutate_delete_nodes(self, p):
         "Randomly delete nodes in this BodyPartGraph with probability p"
-        for i in range(len(self.bodyparts)-1, -1, -1):
-            if random.random() < p and len(self.bodyparts) > 1:
+        for i in reversed(sample(len(self.bodyparts), p)):
+            if len(self.bodyparts) > 1:
                 # delete node
                 log.debug('delete node')
                 self.mutations += 1
@@ -668,12 +741,12 @@ class BodyPartGraph(Persistent):
 
     def mutate_copy_nodes(self, p):
         "Randomly copy nodes in this BodyPartGraph with probability p"
-        for i in range(len(self.bodyparts)):
-            if random.random() < p and len(self.bodyparts) < BPG_MAX_NODES:
+        for i in sample(len(self.bodyparts), p):
+            if len(self.bodyparts) < BPG_MAX_NODES:
                 # copy and mutate node
                 log.debug('copy node')
                 self.mutations += 1
-                c = copy.deepcopy(self.bodyparts[i])
+                c = self.bodyparts[i].clone()
                 # we did in fact just copy everything the bp links to ...
                 # fixme: correct? yes? efficient? probably not.
                 c.edges = PersistentList()
@@ -701,19 +774,18 @@ class BodyPartGraph(Persistent):
     def mutate_inputmaps(self, p):
         "Randomly rewire input_maps in each BodyPart with probability p"
         for bp in self.bodyparts:
-            for _ in range(len(bp.input_map)):
-                if random.random() < p:
-                    log.debug('mutate input_map')
-                    self.mutations += 1
-                    di = random.choice(bp.input_map.keys())
-                    if random.random() < 0.5:
-                        del bp.input_map[di]
-                    else:
-                        # mutate weight
-                        xp = random.randrange(0,len(bp.input_map[di]))
-                        x = list(bp.input_map[di][xp])
-                        x[2] = rnd(-7,7,x[2])
-                        bp.input_map[di][xp] = tuple(x)
+            for _ in sample(len(bp.input_map), p):
+                log.debug('mutate input_map')
+                self.mutations += 1
+                di = random.choice(bp.input_map.keys())
+                if random.random() < 0.5:
+                    del bp.input_map[di]
+                else:
+                    # mutate weight
+                    xp = random.randrange(0,len(bp.input_map[di]))
+                    x = list(bp.input_map[di][xp])
+                    x[2] = rnd(-7,7,x[2])
+                    bp.input_map[di][xp] = tuple(x)
 
         self.connectInputNodes()
         self.sanityCheck()
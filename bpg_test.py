@@ -4,6 +4,7 @@ import os
 import unittest
 import random
 import pickle
+import copy
 import sys
 import testoob
 
@@ -13,6 +14,10 @@ import test_common
 from test_common import *
 from plot import *
 
+def nodes(g):
+    "The nodes of the networks of bodypart graph g"
+    return [n for bp in g.bodyparts for n in bp.network]
+
 class BodyPartTest(unittest.TestCase):
     def test_0_init(self):
         self.bp = bpg.BodyPart(new_network_args)
@@ -76,5 +81,97 @@ class BodyPartGraphTest(unittest.TestCase):
         for _ in range(3):
             self.bpg.mutate(1)
 
+    def summary(self, g):
+        "The state of g, with bodyparts and nodes replaced by their indices"
+        bps = list(g.bodyparts)
+        def ref(x):
+            if x in bps:
+                return ('bp', bps.index(x))
+            for (i, bp) in enumerate(bps):
+                if x in bp.network:
+                    return ('node', i, list(bp.network).index(x))
+            return x
+        s = [ref(g.root)]
+        for bp in bps:
+            s.append(sorted([(k, v) for (k, v) in bp.__dict__.items()
+                if k not in ('network', 'edges', 'input_map', 'motor_input')
+                and not k.startswith('_v_')]))
+            s.append([(ref(e.child), e.joint_end, e.terminal_only) for e in bp.edges])
+            s.append(sorted([(ref(k), [tuple(map(ref, x)) for x in v]) for (k, v) in bp.input_map.items()]))
+            s.append([x and tuple(map(ref, x)) for x in bp.motor_input])
+            net = bp.network
+            s.append([map(ref, net.inputs), map(ref, net.outputs), net.adjacency])
+            for n in net:
+                s.append((type(n), sorted([x for x in n.par.__dict__.items() if not x[0].startswith('_v_')]), map(ref, n.inputs),
+                    sorted([(k, v) for (k, v) in n.__dict__.items() if k not in ('inputs', 'par')])))
+        return s
+
+    def test_6_clone(self):
+        "clone gives the same copy as deepcopy, sharing nothing"
+        self.test_1_init()
+        self.bpg.mutate(0.5)
+        c = self.bpg.clone()
+        self.assertEqual(self.summary(c), self.summary(copy.deepcopy(self.bpg)))
+        self.assertEqual(self.summary(c), self.summary(self.bpg))
+        for (x, y) in zip(c.bodyparts, self.bpg.bodyparts):
+            self.assertTrue(x is not y and x.network is not y.network)
+            for (n, m) in zip(x.network, y.network):
+                self.assertTrue(n is not m and n.par is not m.par)
+
+    def test_7_step(self):
+        "Stepping all networks with one engine is the same as one at a time"
+        args = dict(new_network_args)
+        args['update_style'] = 'sync'
+        for (c, a) in ((node.SigmoidNode, new_node_args_sigmoid),
+                       (node.BeerNode, new_node_args_sigmoid),
+                       (node.TagaNode, new_node_args_sigmoid),
+                       (node.SigmoidNode, {'weightDomain':(-7,7), 'quanta':8})):
+            args['new_node_class'] = c
+            args['new_node_args'] = a
+            while 1:
+                g = bpg.BodyPartGraph(args)
+                g.connectInputNodes()
+                p = g.unroll()
+                if len(p.bodyparts) > 1:
+                    break
+            p.connectInputNodes()
+            q = p.clone()
+            def step(t):
+                if t < 5:
+                    # the engine of each network holds state that the joined
+                    # engine has to take over
+                    for bp in p.bodyparts:
+                        bp.network.step()
+                else:
+                    p.step()
+                for bp in q.bodyparts:
+                    bp.network.step()
+            outputs = lambda g: [n.output for n in nodes(g)]
+            compareSteps(self, (p, q), step, outputs, 20, nodes)
+            self.assertTrue(p.getEngine())
+
+    def test_8_prune(self):
+        "Only stepping the nodes that can affect the motors doesn't change them"
+        args = dict(new_network_args)
+        args.update(update_style='sync', topology='nk', radius=1, num_nodes=8)
+        while 1:
+            g = bpg.BodyPartGraph(args)
+            g.connectInputNodes()
+            p = g.unroll()
+            p.connectInputNodes()
+            q = p.clone()
+            (stepped, total) = p.prune()
+            if stepped < total:
+                break
+        self.assertEqual(total, sum([len(bp.network) for bp in p.bodyparts]))
+        self.assertEqual(stepped, sum([len(bp.network.live) for bp in p.bodyparts]))
+        def step(t):
+            p.step()
+            q.step()
+        # the outputs of the nodes that drive the motors
+        motors = lambda g: [i[1].output for bp in g.bodyparts for i in bp.motor_input
+                            if i and isinstance(i[1], node.Node)]
+        compareSteps(self, (p, q), step, motors, 20, nodes)
+
 if __name__ == "__main__":
     test_main()
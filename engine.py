@@ -0,0 +1,1032 @@
+"""engine.py - compiled execution engines for control networks.
+
+A Network keeps its neurons as a list of persistent Node objects, which suits
+evolution but is slow to step: every weighted sum walks python lists of inputs
+and weights. An engine packs the weights of a network into
+arrays (padded rows, or sparse rows when the number of inputs varies a lot
+between nodes) and the node outputs into a vector, so that a whole
+synchronous step is a handful of array operations. Async networks are updated a node at a time
+over the same arrays, in an order drawn in blocks from a numpy generator.
+
+The nodes are still what everything else reads (the simulator, signal logging
+and plotting), so after every step the engine writes the new outputs back to
+them. Engines are never stored in the database; Network keeps its engine in a
+volatile attribute and drops it whenever the nodes might have changed."""
+
+import math
+import random
+import logging
+from collections import OrderedDict
+
+import numpy
+
+import node
+import transfer
+import validate
+
+log = logging.getLogger('engine')
+log.setLevel(logging.WARN)
+
+def roundHalfUp(x):
+    """round() for arrays. numpy.round rounds halves to even, but the node
+    models use the python builtin which rounds halves away from zero."""
+    if numpy.isscalar(x):
+        # async engines update one node at a time
+        return round(x)
+    a = numpy.abs(x)
+    f = numpy.floor(a)
+    return numpy.sign(x) * numpy.where(a - f >= 0.5, f + 1, f)
+
+def quantise(x, quanta):
+    "Array version of node.quantise"
+    if not quanta:
+        return x
+    return roundHalfUp((quanta-1)*x)/(quanta-1)
+
+def quantiseDomain((l,h), x, q):
+    "Array version of node.quantiseDomain"
+    if numpy.isscalar(x):
+        return node.quantiseDomain((l,h), x, q)
+    x = numpy.minimum(numpy.maximum(x, float(l)), float(h))
+    if not q:
+        return x
+    return roundHalfUp((x-l)/(h-l)*(q-1))*(h-l)/(q-1)+l
+
+def sigmoid(quanta):
+    """The output function of SigmoidNode and BeerNode for arrays. Quantised
+    outputs are looked up in a level table (see transfer.py), otherwise it is
+    the same arithmetic as the node models."""
+    if quanta:
+        return transfer.sigmoid(quanta).vector
+    return lambda x: 1/(1 + numpy.power(math.e, -x))
+
+# index of all nodes, the default for preUpdate and postUpdate
+ALL = slice(None)
+# number of steps of async update order that are drawn at a time
+ASYNC_BLOCK = 100
+
+# memoStats[(engine class name, quanta)] = [hits, misses] of the engines
+# dropped since the last reportMemo, see Engine.report
+memoStats = {}
+
+def hitRate(hits, misses):
+    "Percentage of hits"
+    return 100.0 * hits / max(1, hits + misses)
+
+def reportMemo():
+    """Log the transition cache hit rates of the engines since the last call,
+    eg. of one simulation, and start counting again"""
+    for (k, (hits, misses)) in sorted(memoStats.items()):
+        log.info('%s quanta %s: transition cache hit rate %.1f%% (%d steps)',
+                k[0], k[1], hitRate(hits, misses), hits + misses)
+    memoStats.clear()
+
+# inputs are stored sparse when padding every node to the longest row of slots
+# would leave more than this fraction of them unused, see makeSlots
+SPARSE_PADDING = 0.5
+# spiking networks with at least EVENT_SLOTS inputs sum only the inputs of the
+# nodes that sent something, on steps where those are less than
+# EVENT_FRACTION of all inputs, see EventSlots. Below that, summing every input
+# is cheaper than finding the events.
+EVENT_SLOTS = 2048
+EVENT_FRACTION = 0.25
+
+class Slots(object):
+    """Weighted inputs of every node, padded to the same number of slots.
+    Node i sums elements S[i] of the input vector with weights V[i], and
+    unused slots have weight 0. A sum over all nodes is one array operation
+    over n*k slots, where k is the longest row."""
+
+    def __init__(self, rows, dtype):
+        "rows[i] is a list of (input vector index, weight) for node i"
+        k = max([1] + [len(r) for r in rows])
+        self.S = numpy.zeros((len(rows), k), int)
+        self.V = numpy.zeros((len(rows), k), dtype)
+        for (i, r) in enumerate(rows):
+            if r:
+                (self.S[i,:len(r)], self.V[i,:len(r)]) = zip(*r)
+
+    def setWeights(self, f):
+        "Replace the weights w with f(w)"
+        self.V = f(self.V)
+
+    def wsum(self, v, i=ALL):
+        "Sums of nodes i added slot by slot, see Engine.wsum"
+        # cumsum adds strictly left to right, unlike sum and dot
+        return (v[self.S[i]] * self.V[i]).cumsum(-1)[...,-1]
+
+    def isum(self, v, i=ALL):
+        "Sums of nodes i, for integer weights where the order doesn't matter"
+        return (v[self.S[i]] * self.V[i]).sum(-1)
+
+class SparseSlots(object):
+    """Weighted inputs of every node in compressed sparse row form. The inputs
+    of node i are elements S[P[i]:P[i+1]] of the input vector with weights
+    V[P[i]:P[i+1]]. A sum over all nodes costs the number of inputs, in one
+    array operation per slot: rows[j] are the nodes with a slot j, whose
+    inputs are at at[j]."""
+
+    def __init__(self, rows, dtype):
+        n = len(rows)
+        lengths = numpy.array([len(r) for r in rows], int)
+        self.P = numpy.concatenate(([0], lengths.cumsum()))
+        self.S = numpy.zeros(self.P[-1], int)
+        self.V = numpy.zeros(self.P[-1], dtype)
+        for (i, r) in enumerate(rows):
+            if r:
+                (self.S[self.P[i]:self.P[i+1]], self.V[self.P[i]:self.P[i+1]]) = zip(*r)
+        self.rows = []
+        self.at = []
+        for j in range(max([0] + lengths.tolist())):
+            r = numpy.flatnonzero(lengths > j)
+            self.rows.append(r)
+            self.at.append(self.P[r] + j)
+        self.zero = numpy.zeros(n, dtype)
+
+    def setWeights(self, f):
+        "Replace the weights w with f(w)"
+        self.V = f(self.V)
+        self.zero = numpy.zeros(len(self.zero), self.V.dtype)
+
+    def wsum(self, v, i=ALL):
+        "Sums of nodes i added slot by slot, see Engine.wsum"
+        if numpy.isscalar(i):
+            # a single node, as async networks update them
+            a = slice(self.P[i], self.P[i+1])
+            return (v[self.S[a]] * self.V[a]).cumsum()[-1] if self.P[i+1] > self.P[i] else self.zero[i]
+        x = v[self.S] * self.V
+        total = self.zero.copy()
+        for (r, at) in zip(self.rows, self.at):
+            total[r] += x[at]
+        return total[i]
+
+    def isum(self, v, i=ALL):
+        "Sums of nodes i, for integer weights where the order doesn't matter"
+        return self.wsum(v, i)
+
+class EventSlots(object):
+    """Weighted inputs of a spiking network, where most nodes send 0 on most
+    steps. Only the fan-out of the nodes that send something is summed (for
+    SrmNode that includes the tails of its spike kernels), so a step costs the
+    number of events rather than the number of connections. Inputs at index n
+    and above of the input vector are external, and those are summed every
+    step. The terms are added in slot order, so the sums are the same as those
+    of Slots: the terms left out are all 0."""
+
+    def __init__(self, rows, n, dtype=float):
+        # busy steps and single async nodes are summed in the usual way
+        self.dense = makeSlots(rows, dtype)
+        self.n = n
+        k = max([1] + [len(r) for r in rows])
+        # the internal slots sorted by source, so that the fan-out of source s
+        # is entries F[s]:F[s+1]. key orders them by target and slot.
+        entries = []
+        for (t, r) in enumerate(rows):
+            for (j, (s, w)) in enumerate(r):
+                if s < n:
+                    # the external inputs of a node follow the internal ones
+                    assert j == 0 or r[j-1][0] < n
+                    entries.append((s, t*k + j, t, w))
+        entries.sort()
+        (src, key, target, weight) = zip(*entries) or ((), (), (), ())
+        self.src = numpy.array(src, int)
+        self.key = numpy.array(key, int)
+        self.target = numpy.array(target, int)
+        self.weight = numpy.array(weight, dtype)
+        self.F = numpy.searchsorted(self.src, numpy.arange(n+1))
+        # the external slots: nodes rows[j] have a slot j at S[j]
+        ext = [[x for x in r if x[0] >= n] for r in rows]
+        self.external = []
+        for j in range(max([0] + [len(e) for e in ext])):
+            r = [t for (t, e) in enumerate(ext) if len(e) > j]
+            (s, w) = zip(*[ext[t][j] for t in r])
+            self.external.append((numpy.array(r, int), numpy.array(s, int), numpy.array(w, dtype)))
+        self.zero = numpy.zeros(len(rows), dtype)
+
+    def wsum(self, v, i=ALL):
+        "Sums of nodes i added slot by slot, see Engine.wsum"
+        if not isinstance(i, slice):
+            return self.dense.wsum(v, i)
+        a = numpy.flatnonzero(v[:self.n])
+        starts = self.F[a]
+        lengths = self.F[a+1] - starts
+        m = lengths.sum()
+        if m > EVENT_FRACTION * len(self.src):
+            return self.dense.wsum(v, i)
+        if m:
+            # entries of the fan-outs of the sources a, in target and slot order
+            e = numpy.repeat(starts - (lengths.cumsum() - lengths), lengths) + numpy.arange(m)
+            e = e[numpy.argsort(self.key[e])]
+            # bincount adds the terms one at a time, in order
+            total = numpy.bincount(self.target[e], v[self.src[e]] * self.weight[e], len(self.zero))
+        else:
+            total = self.zero.copy()
+        for (r, s, w) in self.external:
+            total[r] += v[s] * w
+        return total[i]
+
+def makeSlots(rows, dtype=float):
+    """Slots for rows, sparse if the lengths of the rows differ enough that
+    padding them would waste more than SPARSE_PADDING of the slots"""
+    k = max([1] + [len(r) for r in rows])
+    used = sum([len(r) for r in rows])
+    if len(rows)*k - used > SPARSE_PADDING * len(rows)*k:
+        return SparseSlots(rows, dtype)
+    return Slots(rows, dtype)
+
+class Engine(object):
+    """Base class for engines. Subclasses step a particular node model.
+
+    The inputs of all nodes are gathered into one vector, the signals of the
+    nodes followed by the external input values, and the connections into
+    the slots of each node (see Slots and SparseSlots). Weighted sums are
+    accumulated slot by slot, in the same order as
+    WeightNode.wsum, so that they are bit for bit the same as the node
+    models (with quantised nets a different rounding error can push a value
+    into the next quantum).
+
+    preUpdate(i) and postUpdate(i) update the nodes selected by the index i,
+    all of them by default. Arrays are updated in place, so that async
+    networks can update one node at a time."""
+
+    # node attributes written back after every step
+    stored = ['output']
+    # node attributes that are only written back by sync()
+    synced = []
+    # other arrays that are part of the network state
+    internal = []
+    # maximum number of cached transitions, 0 for none, see startMemo()
+    memo = 0
+    # whether a quantised sync network has a finite number of states, so that
+    # its transitions can be cached
+    finite = 1
+    # random generator for the update order of async networks, see startAsync()
+    rng = None
+    # input vector kept up to date during an async step
+    vector = None
+    # whether the nodes mostly send 0, see EventSlots
+    events = 0
+
+    def __init__(self, net):
+        self.nodes = list(net)
+        self.quanta = getattr(self.nodes[0], 'quanta', None)
+        # Euler step size, see Network.dt
+        self.dt = getattr(net, 'dt', node.DT)
+        # external input values change every step (they are written by the
+        # simulator), but the set of external inputs is fixed
+        self.externals = [(x, key) for x in self.nodes for key in x.externalKeys]
+        self.inputSlots = self.slots([x.inputs for x in self.nodes])
+        self.output = numpy.array([x.output for x in self.nodes], float)
+
+    def slots(self, inputs, use_external=1):
+        """Return the slots for summing inputs[i] into node i, followed by the
+        external inputs of node i if use_external is set"""
+        return self.pack(self.rows(inputs, use_external))
+
+    def rows(self, inputs, use_external=1, sequential=0):
+        """Return the rows of slots(). If sequential is set the inputs from
+        nodes before node i are read from a second copy of the node signals
+        after the external inputs, see SigmoidEngine."""
+        n = len(self.nodes)
+        index = dict(zip(self.nodes, range(n)))
+        external = dict(zip(self.externals, range(n, n + len(self.externals))))
+        later = n + len(self.externals)
+        rows = []
+        for (i, (x, srcs)) in enumerate(zip(self.nodes, inputs)):
+            weights = dict(zip(x.inputs, x.inputWeights))
+            r = [(index[src], weights[src]) for src in srcs]
+            if sequential:
+                r = [(j + later*(j < i), w) for (j, w) in r]
+            if use_external:
+                r += [(external[(x, key)], w) for (key, w) in zip(x.externalKeys, x.externalWeights)]
+            rows.append(r)
+        return rows
+
+    def pack(self, rows):
+        "Return slots for rows"
+        if self.events and sum([len(r) for r in rows]) >= EVENT_SLOTS:
+            return EventSlots(rows, len(self.nodes))
+        return makeSlots(rows)
+
+    def externalInputs(self):
+        "Current external input values as a vector"
+        return numpy.array([x.externalInputs[key] for (x, key) in self.externals], float)
+
+    def externalValues(self):
+        "Current (quantised) external input values as a vector"
+        return quantise(self.externalInputs(), self.quanta)
+
+    def signal(self, i=ALL):
+        "The values that nodes i send to the nodes they are connected to"
+        return quantise(self.output[i], self.quanta)
+
+    def externalSignal(self):
+        "The external input values as the nodes see them"
+        return self.externalValues()
+
+    def inputVector(self):
+        "The signals of the nodes followed by the external inputs"
+        if self.vector is not None:
+            return self.vector
+        return numpy.concatenate((self.signal(), self.externalSignal()))
+
+    def wsum(self, i=ALL, slots=None):
+        """Weighted sum of inputs for nodes i, see WeightNode.wsum. slots are
+        from slots(), by default all inputs."""
+        return (slots or self.inputSlots).wsum(self.inputVector(), i)
+
+    def externalKey(self):
+        "The external inputs as they are seen by the nodes, as a string"
+        return self.externalValues().tostring()
+
+    def variables(self):
+        "Names of the arrays that make up the network state"
+        return self.stored + self.synced + self.internal
+
+    def startMemo(self, size):
+        """Cache up to size transitions. A quantised sync network is a finite
+        state machine: the next state only depends on the current state and
+        the quantised external inputs. Once it settles into a cycle, eg. a
+        steady gait, each step is a lookup."""
+        self.memo = size
+        self.transitions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def startAsync(self, seed):
+        """Update one node at a time in random order, like Network.stepNodes
+        does for async networks. The order for ASYNC_BLOCK steps at a time is
+        drawn from a numpy generator seeded with seed."""
+        self.seed = seed
+        self.rng = numpy.random.RandomState(seed)
+        self.order = []
+
+    def step(self):
+        "Update every node"
+        if self.rng:
+            self.asyncStep()
+        elif self.memo:
+            self.memoStep()
+        else:
+            self.preUpdate()
+            self.postUpdate()
+        self.store()
+
+    def asyncStep(self):
+        "Update len(nodes) randomly chosen nodes, one at a time"
+        if not self.order:
+            n = len(self.nodes)
+            self.order = self.rng.randint(0, n, (ASYNC_BLOCK, n)).tolist()
+            self.order.reverse()
+        # the input vector only changes where a node has been updated
+        self.vector = self.inputVector()
+        for i in self.order.pop():
+            self.preUpdate(i)
+            self.vector[i] = self.signal(i)
+            self.postUpdate(i)
+            self.vector[i] = self.signal(i)
+        self.vector = None
+
+    def memoStep(self):
+        "Update every node, using the transition cache"
+        names = self.variables()
+        key = ''.join([getattr(self, a).tostring() for a in names]) + self.externalKey()
+        if key in self.transitions:
+            self.hits += 1
+            # move to the most recently used end
+            new = self.transitions.pop(key)
+        else:
+            self.misses += 1
+            self.preUpdate()
+            self.postUpdate()
+            new = [getattr(self, a).copy() for a in names]
+            if len(self.transitions) >= self.memo:
+                self.transitions.popitem(last=False)
+        self.transitions[key] = new
+        # copies, since the arrays are updated in place
+        for (a, v) in zip(names, new):
+            setattr(self, a, v.copy())
+
+    def report(self):
+        """Add the transition cache hits and misses of this engine to memoStats,
+        see reportMemo"""
+        k = (self.__class__.__name__, self.quanta)
+        total = memoStats.setdefault(k, [0, 0])
+        total[0] += self.hits
+        total[1] += self.misses
+        log.debug('%s quanta %s: transition cache hit rate %.1f%% (%d steps)',
+                k[0], k[1], hitRate(self.hits, self.misses), self.hits + self.misses)
+
+    def write(self, attr):
+        "Copy the array self.<attr> to the attribute of the same name in each node"
+        for (x, v) in zip(self.nodes, getattr(self, attr).tolist()):
+            setattr(x, attr, v)
+
+    def store(self):
+        "Write the values that other code reads back to the nodes"
+        for attr in self.stored:
+            self.write(attr)
+
+    def sync(self):
+        """Write all model state back to the nodes, so that they can carry on
+        without the engine"""
+        for attr in self.stored + self.synced:
+            self.write(attr)
+
+class SigmoidEngine(Engine):
+    """Engine for SigmoidNode networks.
+
+    A SigmoidNode computes its output in postUpdate, so in a sync step each
+    node sees the new outputs of the nodes before it in the network and the
+    old outputs of the rest. The engine does the same in stages: the stage of
+    a node is one after the latest stage of the earlier nodes it reads, so
+    the nodes of a stage only depend on outputs that are already final and
+    are updated together. A network with no such links is one stage."""
+
+    def __init__(self, net):
+        Engine.__init__(self, net)
+        self.sigmoid = sigmoid(self.quanta)
+        n = len(self.nodes)
+        index = dict(zip(self.nodes, range(n)))
+        stage = []
+        for (i, x) in enumerate(self.nodes):
+            stage.append(1 + max([-1] + [stage[index[s]] for s in x.inputs if index[s] < i]))
+        stage = numpy.array(stage, int)
+        rows = self.rows([x.inputs for x in self.nodes], sequential=1)
+        # (nodes, where their new signals go in the input vector, their slots)
+        self.stages = []
+        for s in range(max([-1] + stage.tolist()) + 1):
+            i = numpy.flatnonzero(stage == s)
+            self.stages.append((i, n + len(self.externals) + i, self.pack([rows[j] for j in i])))
+
+    def preUpdate(self, i=ALL):
+        pass
+
+    def postUpdate(self, i=ALL):
+        if i is not ALL:
+            # a single node, as async networks update them
+            self.update(i, self.inputSlots.wsum(self.inputVector(), i))
+            return
+        # the old signals, the external inputs and the new signals
+        self.vector = numpy.concatenate((self.inputVector(), self.signal()))
+        for (i, j, slots) in self.stages:
+            self.vector[j] = self.update(i, slots.wsum(self.vector))
+        self.vector = None
+
+    def update(self, i, total):
+        """Set the outputs of nodes i from the weighted sums of their inputs
+        and return their new signals"""
+        # the outputs are already quantised, so they are also the signals
+        self.output[i] = self.sigmoid(total)
+        return self.output[i]
+
+class SineEngine(Engine):
+    """Engine for SineNode networks. The outputs are looked up in the tables
+    of the nodes (see SineNode.getWave), one row per distinct table."""
+
+    synced = ['state', 't']
+    # t counts steps, so no state is ever seen twice
+    finite = 0
+
+    def __init__(self, net):
+        Engine.__init__(self, net)
+        self.t = numpy.array([x.t for x in self.nodes], int)
+        self.state = numpy.array([x.state for x in self.nodes], float)
+        waves = [x.getWave() for x in self.nodes]
+        self.waves = []
+        index = {}
+        for w in waves:
+            if id(w) not in index:
+                index[id(w)] = len(self.waves)
+                self.waves.append(w)
+        self.row = numpy.array([index[id(w)] for w in waves], int)
+        self.extend(self.t.max() + 1)
+
+    def extend(self, steps):
+        "Copy at least steps outputs of the tables into arrays"
+        for w in self.waves:
+            w.extend(steps)
+        h = min([len(w.outputs) for w in self.waves])
+        self.outputs = numpy.array([w.outputs[:h] for w in self.waves], float)
+        self.states = numpy.array([w.states[:h+1] for w in self.waves], float)
+
+    def startMemo(self, size):
+        "The step count makes every state new, so there is nothing to cache"
+        pass
+
+    def preUpdate(self, i=ALL):
+        pass
+
+    def postUpdate(self, i=ALL):
+        t = self.t[i]
+        if numpy.max(t) >= self.outputs.shape[1]:
+            self.extend(numpy.max(t) + 1)
+        self.output[i] = self.outputs[self.row[i], t]
+        self.state[i] = self.states[self.row[i], t+1]
+        self.t[i] = t + 1
+
+class BeerEngine(Engine):
+    "Engine for BeerNode networks"
+
+    stored = ['output', 'state']
+
+    def __init__(self, net):
+        Engine.__init__(self, net)
+        self.state = numpy.array([x.state for x in self.nodes], float)
+        self.nextState = self.state.copy()
+        self.bias = numpy.array([x.par.bias for x in self.nodes], float)
+        self.adaptRate = numpy.array([x.par.adaptRate for x in self.nodes], float)
+        self.sigmoid = sigmoid(self.quanta)
+
+    def preUpdate(self, i=ALL):
+        s = self.state[i] + self.dt * (self.wsum(i) - self.state[i]) / self.adaptRate[i]
+        self.nextState[i] = quantiseDomain((-4,4), s, self.quanta)
+
+    def postUpdate(self, i=ALL):
+        self.state[i] = self.nextState[i]
+        self.output[i] = self.sigmoid(self.state[i] + self.bias[i])
+
+class IfEngine(BeerEngine):
+    """Engine for IfNode networks. Nodes in their refractory period keep their
+    state, the others integrate and fire when they reach threshold."""
+
+    synced = ['t']
+    events = 1
+    # t counts the steps since a node last fired, without limit
+    finite = 0
+
+    def __init__(self, net):
+        BeerEngine.__init__(self, net)
+        self.tr = numpy.array([x.par.tr for x in self.nodes])
+        self.t = numpy.array([x.t for x in self.nodes])
+
+    def postUpdate(self, i=ALL):
+        self.t[i] += 1
+        active = self.t[i] > self.tr[i]
+        state = numpy.where(active, self.nextState[i], self.state[i])
+        # bias is actually used as firing threshold
+        fire = active & (state >= self.bias[i])
+        self.state[i] = numpy.where(fire, 0, state)
+        self.t[i] = numpy.where(fire, 0, self.t[i])
+        self.output[i] = fire
+
+class TagaEngine(Engine):
+    "Engine for TagaNode networks"
+
+    synced = ['u', 'v']
+
+    def __init__(self, net):
+        Engine.__init__(self, net)
+        for a in 'tau0', 'tau1', 'beta', 'b':
+            setattr(self, a, numpy.array([getattr(x.par, a) for x in self.nodes], float))
+        self.u = numpy.array([x.u for x in self.nodes], float)
+        self.v = numpy.array([x.v for x in self.nodes], float)
+        self.next_u = self.u.copy()
+        self.next_v = self.v.copy()
+
+    def preUpdate(self, i=ALL):
+        (u, v) = (self.u[i], self.v[i])
+        next_u = u + self.dt * (-u - self.beta[i]*numpy.maximum(0, v) + self.wsum(i) + self.b[i]) / self.tau0[i]
+        next_v = v + self.dt * (-v + self.output[i]) / self.tau1[i]
+        self.next_u[i] = quantiseDomain((-1,1), next_u, self.quanta)
+        self.next_v[i] = quantiseDomain((0,1), next_v, self.quanta)
+
+    def postUpdate(self, i=ALL):
+        self.u[i] = self.next_u[i]
+        self.v[i] = self.next_v[i]
+        self.output[i] = numpy.maximum(0, self.u[i])
+
+class EkebergEngine(Engine):
+    """Engine for EkebergNode networks. The split of inputs into excitatory
+    and inhibitory ones is done once, and the neuron type constants are
+    looked up by par.i once."""
+
+    synced = ['ye', 'yi', 'yt']
+
+    def __init__(self, net):
+        Engine.__init__(self, net)
+        # sensory input is excitatory
+        self.excite = self.slots([[s for s in x.inputs if s.par.excite] for x in self.nodes])
+        self.inhibit = self.slots([[s for s in x.inputs if not s.par.excite] for x in self.nodes], 0)
+        self.kind = numpy.array([x.par.i for x in self.nodes])
+        for c in 'theta', 'r', 'tau_d', 'mu', 'tau_a':
+            setattr(self, c, numpy.array(getattr(node.EkebergNode, c))[self.kind])
+        x = self.nodes[0]
+        (self.edom, self.idom, self.tdom) = (x.edom, x.idom, x.tdom)
+        self.ye = numpy.array([x.ye for x in self.nodes], float)
+        self.yi = numpy.array([x.yi for x in self.nodes], float)
+        self.yt = numpy.array([x.yt for x in self.nodes], float)
+        self.next_ye = self.ye.copy()
+        self.next_yi = self.yi.copy()
+        self.next_yt = self.yt.copy()
+
+    def preUpdate(self, i=ALL):
+        (ye, yi, yt) = (self.ye[i], self.yi[i], self.yt[i])
+        next_ye = ye + self.dt * (-ye + self.wsum(i, self.excite)) / self.tau_d[i]
+        next_yi = yi + self.dt * (-yi + self.wsum(i, self.inhibit)) / self.tau_d[i]
+        next_yt = yt + self.dt * (-yt + self.output[i]) / self.tau_a[i]
+        self.next_ye[i] = quantiseDomain(self.edom, next_ye, self.quanta)
+        self.next_yi[i] = quantiseDomain(self.idom, next_yi, self.quanta)
+        self.next_yt[i] = quantiseDomain(self.tdom, next_yt, self.quanta)
+
+    def postUpdate(self, i=ALL):
+        self.ye[i] = self.next_ye[i]
+        self.yi[i] = self.next_yi[i]
+        self.yt[i] = self.next_yt[i]
+        o = 1 - numpy.power(math.e, self.r[i] * (self.theta[i] - self.ye[i])) - self.yi[i] - self.mu[i] * self.yt[i]
+        self.output[i] = quantise(numpy.maximum(0, o), self.quanta)
+
+class LogicalEngine(Engine):
+    """Engine for LogicalNode networks.
+
+    Node states are kept as integers. The table index of a node is the dot
+    product of its input digits with the powers of quanta that
+    LogicalNode.preUpdate uses (taken modulo the table size, which gives the
+    same rollover), and all lookup tables are stacked into one array."""
+
+    stored = ['output', 'state']
+
+    def __init__(self, net):
+        self.nodes = list(net)
+        n = len(self.nodes)
+        index = dict(zip(self.nodes, range(n)))
+        self.externals = [(x, key) for x in self.nodes for key in x.externalInputs.keys()]
+        # nodes with a uniform network share one function
+        offsets = {}
+        tables = []
+        self.offset = numpy.zeros(n, int)
+        for (i, x) in enumerate(self.nodes):
+            f = x.par.function
+            assert f.quanta**len(x.inputs) == len(f)
+            if id(f) not in offsets:
+                offsets[id(f)] = sum(map(len, tables))
+                tables.append(f.table.astype(int))
+            self.offset[i] = offsets[id(f)]
+        self.table = numpy.concatenate(tables)
+        self.q = numpy.array([x.par.function.quanta for x in self.nodes])
+        self.size = numpy.array([len(x.par.function) for x in self.nodes])
+        self.extq = numpy.array([x.par.function.quanta for (x, key) in self.externals])
+        # digit vector is the node states followed by the external inputs
+        external = dict(zip(self.externals, range(n, n + len(self.externals))))
+        rows = []
+        for x in self.nodes:
+            f = x.par.function
+            r = [(index[src], f.quanta**j % len(f)) for (j, src) in enumerate(x.inputs)]
+            for (j, key) in enumerate(x.externalInputs.keys()):
+                r.append((external[(x, key)], f.quanta**j % len(f)))
+            rows.append(r)
+        self.inputSlots = makeSlots(rows, int)
+        self.quanta = self.nodes[0].par.function.quanta
+        self.state = numpy.array([x.state for x in self.nodes], int)
+        self.nextState = self.state.copy()
+        self.output = numpy.array([x.output for x in self.nodes], float)
+
+    def externalDigits(self):
+        v = numpy.array([x.externalInputs[key] for (x, key) in self.externals], float)
+        if validate.on:
+            assert ((0 <= v) & (v <= 1)).all()
+        q = self.extq - 1
+        return (roundHalfUp(q*v)/q*q).astype(int)
+
+    def externalKey(self):
+        return self.externalDigits().tostring()
+
+    def signal(self, i=ALL):
+        return self.state[i]
+
+    def externalSignal(self):
+        return self.externalDigits()
+
+    def preUpdate(self, i=ALL):
+        x = self.inputSlots.isum(self.inputVector(), i) % self.size[i]
+        self.nextState[i] = self.table[self.offset[i] + x]
+
+    def postUpdate(self, i=ALL):
+        self.state[i] = self.nextState[i]
+        self.output[i] = self.state[i] / (self.q[i] - 1.0)
+
+# spike histories are kept for 20 steps, in units of 2 steps
+SRM_HISTORY = 10
+srmTables = {}
+
+def srmKernels(quanta):
+    """Return arrays of SrmNode eps and eta, indexed by spike history bitmask.
+
+    Bit j of a history is set if the node fired 2(j+1) steps ago. The sums are
+    done in the same order as SrmNode.preUpdate, youngest spike first."""
+    if quanta not in srmTables:
+        eps = numpy.zeros(2**SRM_HISTORY)
+        eta = numpy.zeros(2**SRM_HISTORY)
+        for m in range(2**SRM_HISTORY):
+            e = 0
+            h = 0
+            for j in range(SRM_HISTORY):
+                if m & (1 << j):
+                    e += node.srmEps(2*(j+1))
+                    h += node.srmEta(2*(j+1))
+            eps[m] = node.quantiseDomain((0,1.0), e, quanta)
+            eta[m] = node.quantiseDomain((-1.1,0), h, quanta)
+        srmTables[quanta] = (eps, eta)
+    return srmTables[quanta]
+
+class SrmEngine(Engine):
+    """Engine for SrmNode networks.
+
+    The spike history of each node is a bitmask instead of a list of spike
+    times: bit j is set if the node fired 2j steps ago. Because a node can
+    fire at most once per step the history is complete, and ageing it is a
+    shift."""
+
+    stored = ['output', 'state']
+    internal = ['spikes', 'eps', 'eta', 'hasEps']
+    events = 1
+
+    def __init__(self, net):
+        Engine.__init__(self, net)
+        (self.epsTable, self.etaTable) = srmKernels(self.quanta)
+        self.ft = numpy.array([x.par.ft for x in self.nodes], float)
+        self.state = numpy.array([x.state for x in self.nodes], float)
+        self.spikes = numpy.array([sum([1 << (s/2) for s in set(x.spikes)]) for x in self.nodes])
+        # an async node that hasn't been updated yet has no eps, see
+        # WeightNode.wsum
+        self.hasEps = numpy.array([hasattr(x, 'eps') for x in self.nodes])
+        self.eps = numpy.array([getattr(x, 'eps', 0) for x in self.nodes], float)
+        self.eta = numpy.array([getattr(x, 'eta', 0) for x in self.nodes], float)
+
+    def signal(self, i=ALL):
+        # other SRM nodes see the postsynaptic potential, not the spikes
+        return numpy.where(self.hasEps[i], self.eps[i], quantise(self.output[i], self.quanta))
+
+    def preUpdate(self, i=ALL):
+        # spikes less than 20 steps old get 2 steps older
+        self.spikes[i] = (self.spikes[i] & (2**SRM_HISTORY-1)) << 1
+        self.eps[i] = self.epsTable[self.spikes[i] >> 1]
+        self.eta[i] = self.etaTable[self.spikes[i] >> 1]
+        self.hasEps[i] = True
+
+    def postUpdate(self, i=ALL):
+        self.state[i] = quantiseDomain((-4,4), self.wsum(i) + self.eta[i], self.quanta)
+        fire = self.state[i] > self.ft[i]
+        self.spikes[i] |= fire
+        self.output[i] = fire
+
+    def sync(self):
+        Engine.sync(self)
+        for (i, x) in enumerate(self.nodes):
+            x.spikes = [2*j for j in range(SRM_HISTORY+1) if self.spikes[i] & (1 << j)]
+            if self.hasEps[i]:
+                x.eps = float(self.eps[i])
+                x.eta = float(self.eta[i])
+
+# Fixed point mode, for quantised networks. Node states are kept as integer
+# levels in [0,quanta-1] and weights as fixed point multiples of
+# 1/((quanta-1) * 2**FRAC), so weighted sums are done in integer arithmetic
+# and transfer functions are table lookups. So are the Euler steps of node
+# states: the next level of a state is found from its current level and the
+# fixed point sum by thresholds (see stateThresholds). Weights of a quantised
+# network with an integer weight domain are exact in this form (external input
+# weights are not quantised). The results are the same as the node
+# models except when a sum is within rounding error of a quantisation
+# boundary, which is why it has to be asked for (Network.fixed).
+FRAC = 16
+fixedTables = {}
+
+def sigmoidThresholds(quanta):
+    """Return T, where the quantised sigmoid of a fixed point sum N is level k
+    for T[k-1] <= N < T[k]"""
+    key = ('sigmoid', quanta)
+    if key not in fixedTables:
+        x = transfer.sigmoid(quanta).thresholds
+        fixedTables[key] = numpy.ceil(x * (quanta-1)**2 * 2**FRAC).astype(int)
+    return fixedTables[key]
+
+def ekebergTable(quanta, edom, idom, tdom):
+    "Return the EkebergNode output level for every neuron type, ye, yi and yt"
+    key = ('ekeberg', quanta, edom, idom, tdom)
+    if key not in fixedTables:
+        c = node.EkebergNode
+        (i, e, h, t) = numpy.ix_(range(4), range(quanta), range(quanta), range(quanta))
+        ye = e * float(edom[1]-edom[0]) / (quanta-1) + edom[0]
+        yi = h * float(idom[1]-idom[0]) / (quanta-1) + idom[0]
+        yt = t * float(tdom[1]-tdom[0]) / (quanta-1) + tdom[0]
+        r = numpy.array(c.r)[i]
+        theta = numpy.array(c.theta)[i]
+        mu = numpy.array(c.mu)[i]
+        o = numpy.maximum(0, 1 - numpy.power(math.e, r * (theta - ye)) - yi - mu * yt)
+        fixedTables[key] = roundHalfUp((quanta-1) * o).astype(numpy.uint8)
+    return fixedTables[key]
+
+def stateThresholds(quanta, dt, tau, (l,h)):
+    """Return T, where a state at level k of domain (l,h) that takes the Euler
+    step v + dt*(w-v)/tau towards a weighted sum w goes to level m for
+    T[k,m-1] <= N < T[k,m], N being w in fixed point (see FixedPoint.isum).
+
+    Quantised weights and parameters often put a step exactly on the boundary
+    between two levels, so the thresholds are moved to where the float
+    arithmetic of the node models changes level."""
+    key = ('state', quanta, dt, tau, l, h)
+    if key not in fixedTables:
+        scale = float((quanta-1)**2 * 2**FRAC)
+        # the same arithmetic as the node models and quantiseDomain
+        v = numpy.arange(quanta)[:,numpy.newaxis] * float(h-l) / (quanta-1) + l
+        def level(N):
+            x = v + dt * (N / scale - v) / tau
+            x = numpy.minimum(numpy.maximum(x, float(l)), float(h))
+            return roundHalfUp((x-l)/(h-l)*(quanta-1))
+        m = numpy.arange(1, quanta)[numpy.newaxis,:]
+        w = (((m-0.5) * (h-l) / (quanta-1) + l - v) * tau / dt + v)
+        T = numpy.ceil(w * scale).astype(int)
+        while 1:
+            down = level(T-1) >= m
+            up = level(T) < m
+            if not (down.any() or up.any()):
+                break
+            T += up.astype(int) - down
+        fixedTables[key] = T
+    return fixedTables[key]
+
+def stepLevels(T, N):
+    "Levels reached by fixed point sums N, for rows of thresholds T (see stateThresholds)"
+    return (T <= numpy.expand_dims(N, -1)).sum(-1)
+
+def ekebergAdaptTable(quanta, tdom, dt):
+    """Return the next EkebergNode yt level for every neuron type, yt level and
+    output level"""
+    key = ('ekebergAdapt', quanta, tdom, dt)
+    if key not in fixedTables:
+        c = node.EkebergNode
+        (i, t, o) = numpy.ix_(range(4), range(quanta), range(quanta))
+        yt = t * float(tdom[1]-tdom[0]) / (quanta-1) + tdom[0]
+        yt = yt + dt * (-yt + o / (quanta-1.0)) / numpy.array(c.tau_a)[i]
+        yt = quantiseDomain(tdom, yt, quanta)
+        fixedTables[key] = roundHalfUp((yt - tdom[0]) / (tdom[1]-tdom[0]) * (quanta-1)).astype(int)
+    return fixedTables[key]
+
+class FixedPoint:
+    """Mixin for fixed point engines. The integer level of the node outputs is
+    kept in self.level."""
+
+    def pack(self, rows):
+        s = Engine.pack(self, rows)
+        s.setWeights(lambda w: roundHalfUp(w * (self.quanta-1) * 2**FRAC).astype(int))
+        return s
+
+    def levels(self, x, (l,h)=(0,1)):
+        "Quantise values in domain (l,h) to integer levels"
+        x = numpy.minimum(numpy.maximum(x, float(l)), float(h))
+        return numpy.asarray(roundHalfUp((x-l)/(h-l)*(self.quanta-1)), int)
+
+    def values(self, k, (l,h)=(0,1)):
+        "Value of integer levels k in domain (l,h)"
+        return k*float(h-l)/(self.quanta-1)+l
+
+    def signal(self, i=ALL):
+        return self.level[i]
+
+    def externalSignal(self):
+        # levels() quantises the values itself
+        return self.levels(self.externalInputs())
+
+    def isum(self, i=ALL, slots=None):
+        """Fixed point weighted sum of inputs. N stands for the sum
+        N / ((quanta-1)**2 * 2**FRAC)."""
+        return (slots or self.inputSlots).isum(self.inputVector(), i)
+
+    def wsum(self, i=ALL, slots=None):
+        return self.isum(i, slots) / ((self.quanta-1.0)**2 * 2**FRAC)
+
+class FixedSigmoidEngine(FixedPoint, SigmoidEngine):
+    "Fixed point engine for quantised SigmoidNode networks"
+
+    internal = ['level']
+
+    def __init__(self, net):
+        SigmoidEngine.__init__(self, net)
+        self.level = self.levels(self.output)
+        self.thresholds = sigmoidThresholds(self.quanta)
+
+    def update(self, i, total):
+        self.level[i] = numpy.searchsorted(self.thresholds, total, 'right')
+        self.output[i] = self.values(self.level[i])
+        return self.level[i]
+
+class FixedBeerEngine(FixedPoint, BeerEngine):
+    """Fixed point engine for quantised BeerNode networks. The next state level
+    is found from the weighted sum by thresholds, one table for each
+    adaptRate (they are quantised too, so there are few), and the output of
+    each node is looked up by its state level."""
+
+    internal = ['level', 'stateLevel']
+
+    def __init__(self, net):
+        BeerEngine.__init__(self, net)
+        self.level = self.levels(self.output)
+        self.stateLevel = self.levels(self.state, (-4,4))
+        self.nextStateLevel = self.stateLevel.copy()
+        s = self.values(numpy.arange(self.quanta), (-4,4))
+        self.outputTable = transfer.sigmoid(self.quanta).levels(s[numpy.newaxis,:] + self.bias[:,numpy.newaxis])
+        self.rows = numpy.arange(len(self.nodes))
+        rates = sorted(set(self.adaptRate.tolist()))
+        self.stateTable = numpy.array([stateThresholds(self.quanta, self.dt, r, (-4,4)) for r in rates])
+        self.stateRow = numpy.searchsorted(rates, self.adaptRate)
+        # reset() leaves the states in (-0.1,0.1), between the levels
+        self.offLevel = self.values(self.stateLevel, (-4,4)) != self.state
+
+    def preUpdate(self, i=ALL):
+        if self.offLevel[i].any():
+            s = self.state[i] + self.dt * (self.wsum(i) - self.state[i]) / self.adaptRate[i]
+            self.nextStateLevel[i] = self.levels(s, (-4,4))
+            self.offLevel[i] = False
+        else:
+            T = self.stateTable[self.stateRow[i], self.stateLevel[i]]
+            self.nextStateLevel[i] = stepLevels(T, self.isum(i))
+
+    def postUpdate(self, i=ALL):
+        self.stateLevel[i] = self.nextStateLevel[i]
+        self.level[i] = self.outputTable[self.rows[i], self.stateLevel[i]]
+        self.state[i] = self.values(self.stateLevel[i], (-4,4))
+        self.output[i] = self.values(self.level[i])
+
+class FixedEkebergEngine(FixedPoint, EkebergEngine):
+    """Fixed point engine for quantised EkebergNode networks. The levels of ye
+    and yi are stepped by thresholds on the excitatory and inhibitory sums,
+    and those of yt and the output are looked up, all by neuron type. The
+    values of ye, yi and yt are only worked out by sync."""
+
+    internal = ['level', 'yeLevel', 'yiLevel', 'ytLevel']
+
+    def __init__(self, net):
+        EkebergEngine.__init__(self, net)
+        q = self.quanta
+        self.outputTable = ekebergTable(q, self.edom, self.idom, self.tdom)
+        self.exciteTable = numpy.array([stateThresholds(q, self.dt, t, self.edom) for t in node.EkebergNode.tau_d])
+        self.inhibitTable = numpy.array([stateThresholds(q, self.dt, t, self.idom) for t in node.EkebergNode.tau_d])
+        self.adaptTable = ekebergAdaptTable(q, self.tdom, self.dt)
+        self.level = self.levels(self.output)
+        self.yeLevel = self.levels(self.ye, self.edom)
+        self.yiLevel = self.levels(self.yi, self.idom)
+        self.ytLevel = self.levels(self.yt, self.tdom)
+        self.next_ye = self.yeLevel.copy()
+        self.next_yi = self.yiLevel.copy()
+        self.next_yt = self.ytLevel.copy()
+
+    def variables(self):
+        return self.stored + self.internal
+
+    def preUpdate(self, i=ALL):
+        k = self.kind[i]
+        self.next_ye[i] = stepLevels(self.exciteTable[k, self.yeLevel[i]], self.isum(i, self.excite))
+        self.next_yi[i] = stepLevels(self.inhibitTable[k, self.yiLevel[i]], self.isum(i, self.inhibit))
+        self.next_yt[i] = self.adaptTable[k, self.ytLevel[i], self.level[i]]
+
+    def postUpdate(self, i=ALL):
+        self.yeLevel[i] = self.next_ye[i]
+        self.yiLevel[i] = self.next_yi[i]
+        self.ytLevel[i] = self.next_yt[i]
+        self.level[i] = self.outputTable[self.kind[i], self.yeLevel[i], self.yiLevel[i], self.ytLevel[i]]
+        self.output[i] = self.values(self.level[i])
+
+    def sync(self):
+        self.ye = self.values(self.yeLevel, self.edom)
+        self.yi = self.values(self.yiLevel, self.idom)
+        self.yt = self.values(self.ytLevel, self.tdom)
+        Engine.sync(self)
+
+FIXED_ENGINES = { node.SigmoidNode : FixedSigmoidEngine,
+                  node.BeerNode : FixedBeerEngine,
+                  node.EkebergNode : FixedEkebergEngine }
+
+ENGINES = { node.SigmoidNode : SigmoidEngine,
+            node.SineNode : SineEngine,
+            node.BeerNode : BeerEngine,
+            node.IfNode : IfEngine,
+            node.TagaNode : TagaEngine,
+            node.EkebergNode : EkebergEngine,
+            node.LogicalNode : LogicalEngine,
+            node.SrmNode : SrmEngine }
+
+def compile(net):
+    """Return an engine for net, or None if it has to be stepped node by node.
+    The update order of async networks is seeded from the random module, so
+    it is reproducible from the run seed."""
+    if not len(net):
+        return None
+    t = type(net[0])
+    for n in net:
+        if type(n) is not t:
+            return None
+    # runtime copies of nodes (see node.runtime) use the engine of their model
+    cls = getattr(t, 'model', t)
+    if cls not in ENGINES:
+        return None
+    engines = ENGINES
+    if getattr(net, 'fixed', 0) and getattr(net[0], 'quanta', None):
+        engines = dict(ENGINES)
+        engines.update(FIXED_ENGINES)
+    log.debug('compile(%s) -> %s', net, engines[cls].__name__)
+    e = engines[cls](net)
+    if net.update_style == 'async':
+        e.startAsync(random.randint(0, 2**32-1))
+    elif getattr(net, 'memo', 0) and e.quanta and e.finite:
+        e.startMemo(net.memo)
+    return e
@@ -0,0 +1,296 @@
+#!/usr/bin/python
+
+from unittest import TestCase
+import copy
+import random
+import numpy
+
+from test_common import *
+from network import Network, TOPOLOGIES
+import engine
+from node import SigmoidNode, SineNode, BeerNode, IfNode, SrmNode, TagaNode, EkebergNode, LogicalNode
+
+random.seed(7)
+
+class EngineTest:
+    "Compare each engine with stepping the nodes one at a time"
+
+    nodea = {}
+    update_style = 'sync'
+    attrs = ['output']
+    steps = 100
+    fixed = 0
+    memo = 0
+    asyncQuanta = 8
+    sparse = 0
+    events = 0
+    dt = None
+
+    def setUp(self):
+        self.padding = engine.SPARSE_PADDING
+        self.eventSlots = engine.EVENT_SLOTS
+        if self.sparse:
+            # store the inputs of every network sparse
+            engine.SPARSE_PADDING = -1
+        if self.events:
+            # sum the events of every spiking network
+            engine.EVENT_SLOTS = 0
+
+    def tearDown(self):
+        engine.SPARSE_PADDING = self.padding
+        engine.EVENT_SLOTS = self.eventSlots
+
+    def network(self, topology, quanta):
+        args = dict(self.nodea)
+        args['quanta'] = quanta
+        net = Network(9, 3, 2, self.nodet, args, topology, self.update_style, 1, 0, self.fixed, self.memo)
+        if self.dt:
+            net.dt = self.dt
+        # connect some external inputs, like the simulator does
+        for n in net.inputs:
+            for sig in 'CONTACT', 'JOINT_0':
+                n.addExternalInput(None, sig, random.uniform(-7,7))
+        net.reset()
+        return net
+
+    def values(self, net):
+        # an SrmNode that hasn't been updated yet has no eps
+        return [[getattr(x, attr, None) for attr in self.attrs] for x in net]
+
+    def compare(self, quanta):
+        for topology in TOPOLOGIES:
+            a = self.network(topology, quanta)
+            b = copy.deepcopy(a)
+            self.assertTrue(b.getEngine())
+            def step(t):
+                a.stepNodes()
+                b.step()
+                b.getEngine().sync()
+            compareSteps(self, (a, b), step, self.values, self.steps)
+
+    def test_0_float(self):
+        self.compare(0)
+
+    def test_1_quantised(self):
+        for quanta in 2, 4, 8, 16, 32, 64:
+            self.compare(quanta)
+
+    def test_2_mutate(self):
+        "Mutating a network throws away its engine"
+        args = dict(self.nodea)
+        args['quanta'] = 2
+        net = Network(9, 3, 2, self.nodet, args, 'full', self.update_style, 1, 0)
+        e = net.getEngine()
+        net.mutate(1)
+        self.assertTrue(net.getEngine() is not e)
+
+    def test_3_memo(self):
+        "The transition cache gives the same results"
+        self.memo = 50
+        self.compare(2)
+
+    def test_4_async(self):
+        "Async engines update nodes in the same way as stepNodes"
+        for topology in TOPOLOGIES:
+            a = self.network(topology, self.asyncQuanta)
+            a.update_style = 'async'
+            b = copy.deepcopy(a)
+            e = b.getEngine()
+            order = numpy.random.RandomState(e.seed).randint(0, len(a), (engine.ASYNC_BLOCK, len(a)))
+            def step(k):
+                for i in order[k]:
+                    a[i].preUpdate(a.dt)
+                    a[i].postUpdate()
+                b.step()
+                e.sync()
+            compareSteps(self, (a, b), step, self.values, engine.ASYNC_BLOCK)
+
+    def test_5_dt(self):
+        "Engines integrate over the step size of their network"
+        self.dt = 0.1
+        self.compare(self.asyncQuanta)
+
+class SlotsTest(TestCase):
+
+    def test_0_choice(self):
+        "Inputs are stored sparse when most slots would be padding"
+        self.assertTrue(isinstance(engine.makeSlots([[(1, 1.0)], [(0, 1.0)]]), engine.Slots))
+        rows = [[(0, 1.0)]] * 9 + [[(j, 1.0) for j in range(9)]]
+        self.assertTrue(isinstance(engine.makeSlots(rows), engine.SparseSlots))
+
+    def test_1_sums(self):
+        "Sparse sums are the same as padded ones"
+        n = 30
+        rows = [[(random.randrange(n), random.uniform(-7, 7)) for _ in range(random.randrange(12))]
+                for _ in range(n)]
+        v = numpy.random.uniform(0, 1, n)
+        (a, b) = (engine.Slots(rows, float), engine.SparseSlots(rows, float))
+        self.assertEqual(a.wsum(v).tolist(), b.wsum(v).tolist())
+        for i in range(n):
+            self.assertEqual(a.wsum(v, i), b.wsum(v, i))
+
+    def test_2_events(self):
+        "Sums over the nodes that sent something are the same as over all inputs"
+        (n, x) = (40, 5)
+        rows = [[(random.randrange(n), random.uniform(-7, 7)) for _ in range(random.randrange(12))] +
+                [(n + random.randrange(x), random.uniform(-7, 7)) for _ in range(random.randrange(3))]
+                for _ in range(n)]
+        (a, b) = (engine.Slots(rows, float), engine.EventSlots(rows, n))
+        for p in 0, 0.05, 0.2, 1:
+            v = numpy.random.uniform(0, 1, n + x)
+            v[:n] *= numpy.random.uniform(0, 1, n) < p
+            self.assertEqual(a.wsum(v).tolist(), b.wsum(v).tolist())
+
+class MemoTest(TestCase):
+
+    def network(self, nodet):
+        net = Network(9, 3, 2, nodet, {'quanta':2}, 'full', 'sync', 1, 0, 0, 50)
+        net.reset()
+        return net
+
+    def test_0_finite(self):
+        "Only networks with a finite number of states cache their transitions"
+        self.assertTrue(self.network(BeerNode).getEngine().memo)
+        for nodet in IfNode, SineNode:
+            self.assertFalse(self.network(nodet).getEngine().memo)
+
+    def test_1_report(self):
+        "Each report only counts the engines since the last one"
+        net = self.network(BeerNode)
+        for _ in range(10):
+            net.step()
+        net.dropEngine()
+        self.assertEqual(sum(engine.memoStats[('BeerEngine', 2)]), 10)
+        engine.reportMemo()
+        self.assertEqual(engine.memoStats, {})
+
+class FixedTest(EngineTest):
+    """Compare fixed point engines with the node models. The engines sum the
+    inputs exactly, and the node models with float rounding error, so they
+    only differ when a sum is within that error of a quantisation boundary
+    (sums that are exactly on one are common, eg. the middle level of a
+    sigmoid is at 0). Such a difference lasts, so the engine is started from
+    the node state for each step.
+
+    Every value must be the same, except that a node may differ when moving
+    the weighted sums of one of the nodes that differ by tolerance makes the
+    node models give the value of the engine. A SigmoidNode passes its
+    difference on to the nodes updated after it, hence any of them."""
+
+    fixed = 1
+    steps = 20
+    # far more than the rounding error of a weighted sum
+    tolerance = 1e-9
+
+    def reference(self, net, e):
+        "Step the nodes of net one at a time, in the order engine e does"
+        if net.update_style == 'sync':
+            net.stepNodes()
+            return
+        order = numpy.random.RandomState(e.seed).randint(0, len(net), (engine.ASYNC_BLOCK, len(net)))
+        for i in order[0]:
+            net[i].preUpdate(net.dt)
+            net[i].postUpdate()
+
+    def same(self, x, y):
+        for attr in self.attrs:
+            if abs(getattr(x, attr) - getattr(y, attr)) > 1e-12:
+                return 0
+        return 1
+
+    def boundary(self, net, e, b, differ):
+        """Return the nodes of b, stepped by engine e from net, that differ
+        from stepping net even with the sums of a node in differ moved by
+        tolerance"""
+        runs = []
+        for k in differ:
+            for d in -self.tolerance, self.tolerance:
+                c = copy.deepcopy(net)
+                wsum = c[k].wsum
+                c[k].wsum = lambda *args, **kw: wsum(*args, **kw) + d
+                self.reference(c, e)
+                runs.append(c)
+        return [k for k in differ if not [c for c in runs if self.same(c[k], b[k])]]
+
+    def compare(self, quanta, update_style='sync'):
+        for topology in TOPOLOGIES:
+            a = self.network(topology, quanta)
+            a.update_style = update_style
+            for _ in range(self.steps):
+                setExternalInputs(a)
+                before = copy.deepcopy(a)
+                b = copy.deepcopy(a)
+                e = b.getEngine()
+                self.assertEqual(isinstance(e, engine.FixedPoint), quanta != 0)
+                self.reference(a, e)
+                b.step()
+                e.sync()
+                differ = [k for (k, (x, y)) in enumerate(zip(a, b)) if not self.same(x, y)]
+                if differ:
+                    self.assertEqual(self.boundary(before, e, b, differ), [])
+
+    def test_4_async(self):
+        "Async fixed point engines update nodes in the same way as the node models"
+        for quanta in 2, self.asyncQuanta:
+            self.compare(quanta, 'async')
+
+class Sigmoid(EngineTest, TestCase):
+    nodet = SigmoidNode
+class Sine(EngineTest, TestCase):
+    nodet = SineNode
+    attrs = ['output', 'state', 't']
+class Beer(EngineTest, TestCase):
+    nodet = BeerNode
+    attrs = ['output', 'state']
+class If(EngineTest, TestCase):
+    nodet = IfNode
+    attrs = ['output', 'state', 't']
+class Srm(EngineTest, TestCase):
+    nodet = SrmNode
+    attrs = ['output', 'state', 'eps', 'eta', 'spikes']
+class Taga(EngineTest, TestCase):
+    nodet = TagaNode
+    attrs = ['output', 'u', 'v']
+class Ekeberg(EngineTest, TestCase):
+    nodet = EkebergNode
+    attrs = ['output', 'ye', 'yi', 'yt']
+class Logical(EngineTest, TestCase):
+    nodet = LogicalNode
+    attrs = ['output', 'state']
+    asyncQuanta = 2
+    def test_0_float(self):
+        "Logical networks are always quantised"
+    def test_1_quantised(self):
+        # lookup tables have quanta**inputs entries
+        for quanta in 2, 3:
+            self.compare(quanta)
+class SparseSigmoid(EngineTest, TestCase):
+    nodet = SigmoidNode
+    sparse = 1
+class SparseSrm(EngineTest, TestCase):
+    nodet = SrmNode
+    attrs = ['output', 'state', 'eps', 'eta', 'spikes']
+    sparse = 1
+class SparseEkeberg(EngineTest, TestCase):
+    nodet = EkebergNode
+    attrs = ['output', 'ye', 'yi', 'yt']
+    sparse = 1
+class SparseLogical(Logical):
+    sparse = 1
+class EventIf(If):
+    events = 1
+class EventSrm(Srm):
+    events = 1
+class FixedSigmoid(FixedTest, TestCase):
+    nodet = SigmoidNode
+class FixedBeer(FixedTest, TestCase):
+    nodet = BeerNode
+    attrs = ['output', 'state']
+class FixedEkeberg(FixedTest, TestCase):
+    nodet = EkebergNode
+    attrs = ['output', 'ye', 'yi', 'yt']
+class SparseFixedBeer(FixedBeer):
+    sparse = 1
+
+if __name__ == "__main__":
+    test_main()
@@ -10,6 +10,9 @@
  -i x                 Select individual with index x
  -d                   debug
  --seed x             Set random seed, x is upto 32 bit hex
+ --validate x         Invariant checking [off,sampled,full] (default full)
+     --vfraction x    Fraction of mutations and evaluations checked when
+                        sampled (default 0.1)
 
 ===== Client mode =====
 
@@ -27,6 +30,8 @@
 
  -p x                 Create initial population of size x
      -q x             Use discrete model with x states
+     --fixed          Step discrete models with fixed point arithmetic
+     --memo x         Cache up to x state transitions of discrete sync networks
      -t x             Run simulation for x seconds (default 30)
      -g x             Final generation, prefix +- for relative (default 99)
      --model x        Type of node [sigmoid,logical,beer,if,ekeberg,sine,srm,taga]
@@ -49,6 +54,8 @@
  --mp x               Mutation probability
  --mut                Mutation type [gauss,uniform]
  --noise x            Standard deviation of Gaussian noise applied to sensors and motors
+ --controlhz x        Rate the networks are stepped at [bpgsim only], a divisor of
+                        the physics rate of 50 (default 50)
 
 ===== Unlock =====
 
@@ -111,10 +118,12 @@ import logging
 
 import bpg
 import db
+import engine
 import evolve
 import network
 import node # ignore checker error about this import
 import sim
+import validate
 import daemon
 import cluster
 from plot import *
@@ -126,7 +135,7 @@ def setup_logging():
     if '-d' in sys.argv:
         level = logging.DEBUG
         sys.argv.remove('-d')
-    for m in 'bpg', 'ev', 'evolve', 'sim', 'glwidget', 'neural', 'qtapp', 'plot':
+    for m in 'bpg', 'ev', 'evolve', 'sim', 'glwidget', 'neural', 'qtapp', 'plot', 'engine':
         l = logging.getLogger(m)
         l.setLevel(level)
     logging.basicConfig()
@@ -141,7 +150,8 @@ def main():
                     'bias=', 'weight=', 'lqr', 'ga=', 'mp=', 'mut=', 'noise=',
                     'network=', 'nostrip', 'plotbpg=', 'pf=', 'plotnets=',
                     'ps=', 'unroll', 'k=', 'toponly', 'movie=', 'sim=', 'seed=',
-                    'fitness=', 'plotpi=', 'plotfc=', 'cluster', 'uniform'])
+                    'fitness=', 'plotpi=', 'plotfc=', 'cluster', 'uniform',
+                    'fixed', 'memo=', 'validate=', 'vfraction=', 'controlhz='])
         log.debug('opts %s', opts)
         log.debug('args %s', args)
         # print help for no args
@@ -199,8 +209,13 @@ def main():
     blank = 0
     mut = 'uniform'
     uniform = 0
+    fixed = 0
+    memo = 0
+    control_hz = None
     seed = random.randint(0,0xFFFFFFFF)
     zodb = None
+    validation = 'full'
+    vfraction = None
     for o, a in opts:
         log.debug('parsing %s %s',o,a)
         if o == '-c':
@@ -223,6 +238,10 @@ def main():
             list_gen = 1
         elif o == '-q':
             quanta = int(a)
+        elif o == '--fixed':
+            fixed = 1
+        elif o == '--memo':
+            memo = int(a)
         elif o == '--movie':
             record = 1
             avifile = a
@@ -303,10 +322,20 @@ def main():
             cluster.startZeoClients()
         elif o == '--seed':
             seed = int(a,16)
+        elif o == '--validate':
+            assert a in validate.LEVELS
+            validation = a
+        elif o == '--vfraction':
+            vfraction = float(a)
+        elif o == '--controlhz':
+            control_hz = int(a)
+            assert sim.HZ % control_hz == 0
         else:
             log.critical('unhandled option %s',o)
             return 1
 
+    validate.setLevel(validation, vfraction)
+
     if record and not qtopts:
         qtopts = '-geometry 640x480'
 
@@ -383,7 +412,9 @@ def main():
                 'topology' : topology,
                 'update_style' : update_style,
                 'radius' : radius,
-                'uniform' : uniform}
+                'uniform' : uniform,
+                'fixed' : fixed,
+                'memo' : memo}
 
         new_sim_args = { 'max_simsecs' : max_simsecs,
                          'noise_sd' : noise}
@@ -392,6 +423,7 @@ def main():
             new_individual_args = { 'network_args' : new_network_args }
             new_sim_fn = sim.BpgSim
             new_sim_args['fitnessName'] = fitnessFunctionName
+            new_sim_args['control_hz'] = control_hz or sim.HZ
         elif simulation == 'pb':
             new_individual_fn = network.Network
             new_individual_args = new_network_args
@@ -570,13 +602,17 @@ def main():
         if root[g].new_sim_fn == sim.BpgSim:
             if not fitnessFunctionName:
                 fitnessFunctionName = root[g].new_sim_args['fitnessName']
-            s = root[g].new_sim_fn(secs, fitnessFunctionName, noise)
+            if not control_hz:
+                control_hz = root[g].new_sim_args.get('control_hz', sim.HZ)
+            s = root[g].new_sim_fn(secs, fitnessFunctionName, noise, control_hz=control_hz)
         elif root[g].new_sim_fn == sim.PoleBalanceSim:
             s = root[g].new_sim_fn(secs, noise_sd=noise)
         if lqr:
             s.setUseLqr(quanta)
         else:
             s.add(root[g][i])
+            if hasattr(s, 'pruned'):
+                log.info('%d of %d nodes can\'t affect the motors and are not stepped', *s.pruned)
         # set up tracing
         plotTrace = 0
         if tracefile:
@@ -604,6 +640,7 @@ def main():
             # run sim without gui
             s.run()
             log.info('Final score was %f', s.score)
+            engine.reportMemo()
         if plotTrace:
             assert traceExt in ['.eps','.pdf', '.fig', '.svg']
             if strip:
@@ -5,7 +5,6 @@ Classes: Evaluation, Generation, Evolver
 These classes work together to carry out genetic algorithm
 evolutionary runs, and provide a place to store the results."""
 
-import copy
 import socket
 import random
 import time
@@ -14,7 +13,9 @@ import os
 import db
 
 import cluster
+import engine
 import rand
+import validate
 
 from persistent import Persistent
 from persistent.list import PersistentList
@@ -144,6 +145,7 @@ class Generation(PersistentList):
         "Always generates a mutated child (m>0)"
         # don't save identical children. shortcut by forcing m>0.
         i = 0
+        validate.select()
         while 1:
             child.mutate(self.mutationRate)
             if child.mutations:
@@ -169,7 +171,7 @@ class Generation(PersistentList):
         # copy the elites into next generation
         count = 1
         for x in self.prev_gen[:num_elites]:
-            y = copy.deepcopy(x)
+            y = x.clone()
             y.parentFitness = x.score
             y.mutations = 0
             self.append(y)
@@ -181,7 +183,7 @@ class Generation(PersistentList):
         # we now have some elites. copy them and mutate to generate children.
         for j in range(num_elites, len(self.prev_gen)):
             p = self.prev_gen[j%num_elites]
-            child = copy.deepcopy(p)
+            child = p.clone()
             self.mutateChild(child)
             assert p.score != None
             child.parentFitness = p.score
@@ -206,7 +208,7 @@ class Generation(PersistentList):
                 if r <= rankv[z]:
                     p = self.prev_gen[z]
                     break
-            y = copy.deepcopy(p)
+            y = p.clone()
             self.mutateChild(y)
             y.parentFitness = p.score
             self.append(y)
@@ -222,7 +224,7 @@ class Generation(PersistentList):
             p = b
             if a.score > b.score:
                 p = a
-            y = copy.deepcopy(p)
+            y = p.clone()
             self.mutateChild(y)
             y.parentFitness = p.score
             self.append(y)
@@ -277,10 +279,12 @@ class Generation(PersistentList):
     def runSim(self, x, quick=0):
         "Evaluate performance of individual(s) x in sim"
 
+        validate.select()
         sim = self.new_sim_fn(quick=quick, **dict(self.new_sim_args))
         sim.add(x)
         sim.run()
         sim.destroy()
+        engine.reportMemo()
         return sim.score
 
     def evaluate(self, x):
@@ -322,7 +326,7 @@ class Generation(PersistentList):
 
         x = random.choice(self)
         log.info('eval %d', self.index(x))
-        y = copy.deepcopy(x)
+        y = x.clone()
         self.mutateChild(y)
         self.evaluate(y)
         assert x.score != None
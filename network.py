@@ -4,11 +4,14 @@ import os
 from random import random, randint, uniform, choice
 from copy import copy
 from cPickle import loads, dumps
+import numpy
 from persistent import Persistent
 from persistent.list import PersistentList
 from persistent.mapping import PersistentMapping
-from node import SigmoidNode, LogicalNode
-from rand import rnd
+from node import SigmoidNode, LogicalNode, runtime, DT
+from rand import rnd, sample
+import engine
+import validate
 
 import logging
 from logging import warn
@@ -17,11 +20,97 @@ log.setLevel(logging.INFO)
 
 TOPOLOGIES = '1d', '2d', 'nk', 'full'
 
+# adjacency of the fixed topologies, keyed by (topology, radius, num_nodes)
+templates = {}
+
+def getTemplate(topology, radius, num_nodes):
+    "Return the positions of the inputs of each node, see Network.adjacency"
+    key = (topology, radius, num_nodes)
+    if key not in templates:
+        if topology == '1d':
+            t = connect1D(num_nodes, radius)
+        elif topology == '2d':
+            t = connect2D(num_nodes, radius)
+        elif topology == 'full':
+            t = connectFull(num_nodes)
+        templates[key] = tuple([tuple(x) for x in t])
+    return templates[key]
+
+def connect1D(num_nodes, radius):
+    "1D ring, cells connect to every other cell in neighbourhood"
+    log.debug('connect1D(%d)', radius)
+    # a 1D network with wrap around, each node has inputs from the previous
+    # and next nodes in the network order
+    neighbourhood = range(-radius, 0) + range(1, radius+1)
+    return [[(target+offset)%num_nodes for offset in neighbourhood]
+            for target in range(num_nodes)]
+
+def connect2D(num_nodes, radius):
+    "A 2D Moore neighbourhood (square, not von Neumann cross)."
+    log.debug('connect2D(num_nodes=%d, radius=%d)', num_nodes, radius)
+    nodes_per_d = math.sqrt(num_nodes)
+    if math.modf(nodes_per_d)[0]:
+        raise '2d topology requested but number of nodes %d is not square'%num_nodes
+
+    diameter = radius*2+1
+    # connect function doesn't work when neighbourhood length wraps around
+    assert nodes_per_d >= diameter
+    # make a torus grid
+    dimension_len = int(nodes_per_d)
+    adjacency = []
+    for i in range(dimension_len): # for dimension 1
+        for j in range(dimension_len): # for dimension 2
+            # for all nodes...
+            target_index = i*dimension_len+j
+            sources = []
+            for y in range(i-radius, i+radius+1):
+                for x in range(j-radius, j+radius+1):
+                    # for coords over the neighbourhood rectangle but not target_node
+                    src_index = (y%dimension_len)*dimension_len + x%dimension_len
+                    if src_index != target_index:
+                        sources.append(src_index)
+            assert len(sources) == diameter**2-1
+            adjacency.append(sources)
+    return adjacency
+
+def connectFull(num_nodes):
+    "Create connections joining every node to every other node"
+    return [[s for s in range(num_nodes) if s != t] for t in range(num_nodes)]
+
+def join(nets):
+    """Return one network made of the nodes of nets, to be stepped by a single
+    engine, or None if they can't be. The networks must be sync and have the
+    same options. Nothing connects them directly (links between them are
+    external inputs), so in a sync step the joined network updates each node
+    exactly as its own network would. It is only used to compile an engine and
+    isn't stored."""
+    n0 = nets[0]
+    for n in nets:
+        if n.update_style != 'sync' or getattr(n, 'fixed', 0) != getattr(n0, 'fixed', 0) \
+                or getattr(n, 'memo', 0) != getattr(n0, 'memo', 0) or n.dt != n0.dt:
+            return None
+    j = Network.__new__(Network)
+    PersistentList.__init__(j, [x for n in nets for x in n.getLive()])
+    j.update_style = 'sync'
+    j.fixed = getattr(n0, 'fixed', 0)
+    j.memo = getattr(n0, 'memo', 0)
+    j.dt = n0.dt
+    j.inputs = [x for n in nets for x in n.inputs]
+    j.outputs = [x for n in nets for x in n.outputs]
+    return j
+
 class Network(PersistentList):
     "Model of a control network; nodes, edges, weights."
 
+    # Euler step size of the continuous time node models, which is the period
+    # at which the network is stepped. BpgSim.add sets it for the control rate.
+    # The Sine, If and Srm models count in steps instead and don't use it, so
+    # their timing is per step, in seconds only at the default rate.
+    dt = DT
+
     def __init__(self, num_nodes, num_inputs, num_outputs, new_node_class,
-            new_node_args, topology, update_style, radius, uniform):
+            new_node_args, topology, update_style, radius, uniform, fixed=0,
+            memo=0):
         # what about k, quanta, nodes_per_input
         PersistentList.__init__(self)
         log.debug('Network.__init__()')
@@ -43,6 +132,10 @@ class Network(PersistentList):
         if new_node_class == LogicalNode:
             new_node_args['numberOfInputs'] = inputsPerNode
         self.uniform = uniform
+        # use fixed point arithmetic for quantised networks, see engine.py
+        self.fixed = fixed
+        # size of the transition cache for quantised networks, see engine.py
+        self.memo = memo
         if not uniform:
             for _ in range(num_nodes):
                 n = new_node_class(par=1, **dict(new_node_args))
@@ -74,9 +167,31 @@ class Network(PersistentList):
         return 'Network[%d]'%len(self)
 
     def destroy(self):
+        self.dropEngine()
         for n in self:
             n.destroy()
 
+    def clone(self):
+        """Return a copy of this network, the same as copy.deepcopy. Genotypes
+        are stored in the database, so they can be pickled, and a pickle round
+        trip runs in C rather than through the generic deepcopy protocol."""
+        return loads(dumps(self, 2))
+
+    def phenotype(self):
+        """Return a copy of this network to simulate. Its nodes are plain
+        __slots__ objects (see node.runtime) that share their parameters with
+        this network, and its node lists are plain lists, so nothing is written
+        back to the genotype when it is stepped."""
+        m = runtime(self, getattr(self, 'adjacency', None))
+        p = Network.__new__(Network)
+        PersistentList.__init__(p, [m[n] for n in self])
+        for (k, v) in self.__dict__.items():
+            if k != 'data' and not k.startswith('_v_'):
+                setattr(p, k, v)
+        p.inputs = [m[n] for n in self.inputs]
+        p.outputs = [m[n] for n in self.outputs]
+        return p
+
     def getNumberOfInputsPerNode(self, topology, radius, num_nodes):
         if topology == '1d':
             return radius * 2
@@ -94,41 +209,47 @@ class Network(PersistentList):
         # MUTATE NODE POSITIONS IN TOPOLOGY
         # The topology never changes so we just randomly select two nodes and
         # swap them
+        self.dropEngine()
         self.mutations = 0
         self.check()
-        for a_index in range(len(self)):
-            # Since a change mutates two nodes, we halve p
-            if random() < p/2:
-                self.mutations += 1
-                # choose another node to swap with
-                b_index = a_index
-                while b_index == a_index:
-                    b_index = randint(0,len(self)-1)
-                tmp_node = self[b_index]
-                self[b_index] = self[a_index]
-                self[a_index] = tmp_node
-                # replace a with b and vice versa for all nodes inputs
-                for n in self:
-                    n.swapInputs(self[a_index], self[b_index])
-                # swap input lists in a and b
-                tmp_inputs = self[a_index].inputs
-                self[a_index].inputs = self[b_index].inputs
-                self[b_index].inputs = tmp_inputs
-                # swap weights
-                if hasattr(self[a_index], 'weights') \
-                   and hasattr(self[b_index], 'weights'):
-                    tmp_weights = self[a_index].weights
-                    self[a_index].weights = self[b_index].weights
-                    self[b_index].weights = tmp_weights
-                # swap externalInputs
-                t = self[a_index].externalInputs
-                self[a_index].externalInputs = self[b_index].externalInputs
-                self[b_index].externalInputs = t
+        if not hasattr(self, 'adjacency'):
+            self.adjacency = self.getAdjacency()
+        # Since a change mutates two nodes, we halve p
+        swaps = sample(len(self), p/2)
+        # fanout[s] is the (target, input) positions fed by position s
+        fanout = [[] for _ in self]
+        if swaps:
+            for (t, sources) in enumerate(self.adjacency):
+                for (j, s) in enumerate(sources):
+                    fanout[s].append((t, j))
+        for a_index in swaps:
+            self.mutations += 1
+            # choose another node to swap with
+            b_index = a_index
+            while b_index == a_index:
+                b_index = randint(0,len(self)-1)
+            a = self[a_index]
+            b = self[b_index]
+            self[a_index] = b
+            self[b_index] = a
+            # the inputs, external inputs and the weights aligned with them
+            # belong to the position, so swap them back
+            attrs = ['inputs', 'externalInputs']
+            if hasattr(a, 'weights') and hasattr(b, 'weights'):
+                attrs += ['inputWeights', 'externalKeys', 'externalIndex', 'externalWeights']
+            for w in attrs:
+                t = getattr(a, w)
+                setattr(a, w, getattr(b, w))
+                setattr(b, w, t)
+            # only the inputs fed by the two positions refer to the nodes
+            for i in a_index, b_index:
+                for (t, j) in fanout[i]:
+                    self[t].inputs[j] = self[i]
+            for i in a_index, b_index:
+                self[i].check()
+            else:
                 for i in a_index, b_index:
-                    self[i].check()
-                else:
-                    for i in a_index, b_index:
-                        self[i].fixup()
+                    self[i].fixup()
 
         # if all nodes use the same pars, only call mutate once
         if self.uniform:
@@ -141,49 +262,100 @@ class Network(PersistentList):
 
         # mutate inputs and outputs
         for puts in self.inputs, self.outputs:
-            for i in range(len(puts)):
-                if random() < p:
-                    old = puts[i]
-                    l = list(set(self)-set(puts))
-                    if l:
-                        self.mutations += 1
-                        new = choice(l)
-                        puts[i] = new
+            for i in sample(len(puts), p):
+                old = puts[i]
+                l = list(set(self)-set(puts))
+                if l:
+                    self.mutations += 1
+                    new = choice(l)
+                    puts[i] = new
 
         if self.topology == 'nk':
             # mutate topology
-            for n in self:
-                assert len(n.inputs) == self.radius # every node has k inputs
-                for x in range(len(n.inputs)):
-                    if random() < p:
-                        self.mutations += 1
-                        # choose a new random input.
-                        others = set(self) - set(n.inputs)
-                        if others:
-                            src = choice(list(others))
-                            t = n.inputs[x]
-                            n.inputs[x] = src
-                            # if using weights, swap old for new input
-                            if hasattr(n, 'weights'):
-                                n.weights[src] = n.weights[t]
-                                del n.weights[t]
+            index = dict(zip(self, range(len(self))))
+            adjacency = list(self.adjacency)
+            # every node has k inputs, so input x of node t is number t*k+x
+            for c in sample(len(self) * self.radius, p):
+                (t, x) = divmod(c, self.radius)
+                n = self[t]
+                assert len(n.inputs) == self.radius
+                self.mutations += 1
+                # choose a new random input.
+                others = set(self) - set(n.inputs)
+                if others:
+                    src = choice(list(others))
+                    # weights are aligned with inputs, so the new
+                    # input takes over the weight of the old one
+                    n.inputs[x] = src
+                    a = list(adjacency[t])
+                    a[x] = index[src]
+                    adjacency[t] = tuple(a)
+            self.adjacency = tuple(adjacency)
 
         if hasattr(self,'weights'):
-            for i in range(4):
-                if random() < p:
-                    self.mutations += 1
-                    self.weights[i] = rnd(-7,7,self.weights[i])
+            for i in sample(4, p):
+                self.mutations += 1
+                self.weights[i] = rnd(-7,7,self.weights[i])
 
         self.check()
         return self.mutations
 
     def reset(self):
+        self.dropEngine()
         for n in self:
             n.reset()
 
+    def getEngine(self):
+        "Return the compiled engine for this network, or None if there isn't one"
+        if not hasattr(self, '_v_engine'):
+            if hasattr(self, 'live'):
+                self._v_engine = engine.compile(join([self]))
+            else:
+                self._v_engine = engine.compile(self)
+        return self._v_engine
+
+    def dropEngine(self):
+        """Discard the compiled engine. This must be called if the nodes are
+        changed other than by stepping the network."""
+        if hasattr(self, '_v_engine'):
+            if self._v_engine:
+                self._v_engine.sync()
+                if self._v_engine.memo:
+                    self._v_engine.report()
+            del self._v_engine
+
+    def prune(self, live=None):
+        """Only step the nodes in live from now on, or every node if live is
+        None. Nothing that is stepped may depend on the others, see
+        BodyPartGraph.prune. Only sync networks can be pruned, since the
+        update order of async networks depends on every node."""
+        self.dropEngine()
+        if live is None:
+            if hasattr(self, 'live'):
+                del self.live
+        else:
+            assert self.update_style == 'sync'
+            self.live = [n for n in self if n in live]
+
+    def getLive(self):
+        "The nodes that are stepped, see prune"
+        return getattr(self, 'live', self)
+
     def step(self):
         """Step every node in the network.
 
+        If there is a compiled engine for this network use it, otherwise step
+        the nodes one at a time with stepNodes()."""
+
+        e = self.getEngine()
+        if e:
+            e.step()
+        else:
+            self.stepNodes()
+
+    def stepNodes(self):
+        """Step every node in the network.
+
         Go through every neuron in the network sequentially and calculate
         its new state given current values from its incoming neurons.
 
@@ -199,23 +371,33 @@ class Network(PersistentList):
 
         if self.update_style == 'sync':
             # synchronous - update all, then actually update the values
-            for n in self:
-                n.preUpdate()
-            for n in self:
+            for n in self.getLive():
+                n.preUpdate(self.dt)
+            for n in self.getLive():
                 n.postUpdate()
         elif self.update_style == 'async':
             # asynchronous - select randomly, then update, n times.
             for _ in range(len(self)):
                 n = choice(self)
-                n.preUpdate()
+                n.preUpdate(self.dt)
                 n.postUpdate()
 
     def check(self):
         log.debug('Network.check()')
+        if not validate.on:
+            return
         assert len(set(self.inputs)) == len(self.inputs)
         assert len(set(self.outputs)) == len(self.outputs)
         for x in self:
             x.check()
+        if hasattr(self, 'adjacency'):
+            assert self.adjacency == self.getAdjacency()
+
+    def getAdjacency(self):
+        """Return the positions of the inputs of each node. The topology is
+        held by position, so swapping nodes in mutate doesn't change it."""
+        index = dict(zip(self, range(len(self))))
+        return tuple([tuple([index[s] for s in n.inputs]) for n in self])
 
     def getNodeName(self, node_index):
         """Return a name for the node at node_index.
@@ -223,7 +405,8 @@ class Network(PersistentList):
         Used for dot graphs etc.
         """
         # strip off network. at begining and Node at end
-        name = str(type(self[node_index]))
+        t = type(self[node_index])
+        name = str(getattr(t, 'model', t))
         a = name.rfind('.')+1
         b = name.rfind("'")
         name = name[a:b]
@@ -236,87 +419,37 @@ class Network(PersistentList):
         log.debug('connect(%s)', topology)
         for n in self:
             assert not n.inputs
-        if topology == '1d':
-            self.connect1D(radius)
-        elif topology == '2d':
-            self.connect2D(radius)
-        elif topology == 'nk':
-            self.connectRandomK(radius)
-        elif topology == 'full':
-            self.connectFull()
-
-    def connect1D(self, radius):
-        "1D ring, cells connect to every other cell in neighbourhood"
-        log.debug('connect1D(%d)', radius)
-        # a 1D network with wrap around
-        # go over all nodes calling target.addInput(src), with src
-        # being the previous and next nodes in the network order
-        neighbourhood = range(-radius, 0) + range(1, radius+1)
-        for target_index in range(len(self)):
-            # for the index of each node
-            for src_offset in neighbourhood:
-                log.debug('type of target node is %s',str(type(self[target_index])))
-                #if not isinstance(self[target_index], InputNode):
-                log.debug('Adding inputs to %s',str(self[target_index]))
-                # for each offset connection to be made
-                src_index = target_index+src_offset
-                # map target_index to [0..len(self.network)-1]
-                # ie. 1D wraparound
-                src_index = src_index%len(self)
-                log.debug('add link %s -> %s', str(self[src_index]), str(self[target_index]))
-                self[target_index].addInput(self[src_index])
-
-    def connect2D(self, radius):
-        "A 2D Moore neighbourhood (square, not von Neumann cross)."
-        log.debug('connect2D(num_nodes=%d, radius=%d)', len(self), radius)
-        nodes_per_d = math.sqrt(len(self))
-        if math.modf(nodes_per_d)[0]:
-            raise '2d topology requested but number of nodes %d is not square'%len(self)
-
-        diameter = radius*2+1
-        # connect function doesn't work when neighbourhood length wraps around
-        assert nodes_per_d >= diameter
-        # make a torus grid
-        dimension_len = int(math.sqrt(len(self)))
-        log.debug('Network2D.connect %dx%d network, neighbourhoods %dx%d',
-                dimension_len, dimension_len, diameter, diameter)
-        for i in range(dimension_len): # for dimension 1
-            for j in range(dimension_len): # for dimension 2
-                # for all nodes...
-                target_index = i*dimension_len+j
-                log.debug('target_index=%d', target_index)
-                for y in range(i-radius, i+radius+1):
-                    for x in range(j-radius, j+radius+1):
-                        log.debug('src y,x=%d,%d', y, x)
-                        # for coords over the neighbourhood rectangle but not target_node
-                        wrapd_y = y%dimension_len
-                        wrapd_x = x%dimension_len
-                        src_index = wrapd_y*dimension_len+wrapd_x
-                        if src_index != target_index:
-                            log.debug('add link %s -> %s', str(self[src_index]), str(self[target_index]))
-                            self[target_index].addInput(self[src_index])
-        for n in self:
-            assert len(n.inputs) == diameter**2-1
+        if topology == 'nk':
+            adjacency = self.connectRandomK(radius)
+        else:
+            adjacency = getTemplate(topology, radius, len(self))
+        for (n, sources) in zip(self, adjacency):
+            n.addInputs([self[s] for s in sources])
+        self.adjacency = adjacency
 
     def connectRandomK(self, radius):
         """Each node has a fixed number of inputs randomly chosen from other nodes.
 
-        Since the topology is random it can be mutated, unlike most Networks."""
+        Since the topology is random it can be mutated, unlike most Networks.
+        Returns the adjacency, drawn from a numpy generator seeded from the
+        random module."""
         log.debug('connectRandomK(%d)', radius)
-        for n in self:
-            for _ in range(radius):
-                while 1:
-                    r = choice(self)
-                    if r != n and r not in n.inputs:
-                        n.addInput(r)
-                        break
-
-    def connectFull(self):
-        "Create connections joining every node to every other node"
-        log.debug('connectFull()')
-        for target in self:
-            # make every other neuron a connected source neuron
-            for source in self:
-                 # not connecting to self and type is sigmoid node (what about others?)
-                if target != source:
-                    target.addInput(source)
+        n = len(self)
+        assert radius < n
+        rng = numpy.random.RandomState(randint(0, 2**32-1))
+        if radius*4 < n:
+            # draw radius of the n-1 other nodes, and redraw the nodes that
+            # got the same input twice. This costs n*radius for big networks.
+            order = rng.randint(0, n-1, (n, radius))
+            while 1:
+                s = numpy.sort(order, 1)
+                again = (s[:, 1:] == s[:, :-1]).any(1)
+                if not again.any():
+                    break
+                order[again] = rng.randint(0, n-1, (again.sum(), radius))
+        else:
+            # the first radius of a random order of the n-1 other nodes
+            order = numpy.argsort(rng.random_sample((n, n-1)), 1)[:, :radius]
+        order += order >= numpy.arange(n)[:, None]
+        return tuple([tuple(x) for x in order.tolist()])
+
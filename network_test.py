@@ -6,11 +6,12 @@ import sys
 import os
 from math import sqrt, floor
 import random
+import copy
 
 import test_common
 from test_common import *
 from network import Network, TOPOLOGIES
-from node import SigmoidNode, BeerNode, EkebergNode, LogicalNode, SineNode, IfNode, SrmNode
+from node import DT, Node, SigmoidNode, BeerNode, EkebergNode, LogicalNode, SineNode, IfNode, SrmNode
 from plot import plotNetwork
 
 random.seed(5)
@@ -69,6 +70,104 @@ class NetworkTest:
     def test_07_uniform(self):
         self.do(4,0,0, 'full', 'async', 1, 1)
 
+    def test_08_phenotype(self):
+        "A phenotype steps like its genotype without changing it"
+        a = Network(9, 3, 2, self.nodet, self.nodea, 'full', 'sync', 1, 0)
+        g = copy.deepcopy(a)
+        p = g.phenotype()
+        before = repr([sorted(n.__dict__.items()) for n in g])
+        for n in p:
+            self.assertTrue(isinstance(n, Node) and isinstance(n, self.nodet))
+            self.assertFalse(hasattr(n, '__dict__'))
+        for net in a, p:
+            for n in net.inputs:
+                n.addExternalInput(None, 'CONTACT', 1.0)
+            random.seed(1)
+            net.reset()
+        for _ in range(20):
+            a.step()
+            p.step()
+            for (x, y) in zip(a, p):
+                self.assertEqual(x.output, y.output)
+        self.assertEqual(before, repr([sorted(n.__dict__.items()) for n in g]))
+
+    def test_09_mutate_adjacency(self):
+        "Swapping nodes in mutate leaves the topology and inputs in place"
+        for topology in TOPOLOGIES:
+            net = Network(9, 3, 2, self.nodet, self.nodea, topology, 'sync', 1, 0)
+            for n in net.inputs:
+                n.addExternalInput(None, 'CONTACT', 1.0)
+            nodes = set(net)
+            externals = [n.externalInputs for n in net]
+            adjacency = net.adjacency
+            net.mutate(1)
+            self.assertEqual(set(net), nodes)
+            self.assertEqual(net.adjacency, net.getAdjacency())
+            if topology != 'nk':
+                self.assertEqual(net.adjacency, adjacency)
+            for (n, e) in zip(net, externals):
+                self.assertTrue(n.externalInputs is e)
+
+    def test_10_templates(self):
+        "Networks of the same shape share a topology template"
+        for topology in TOPOLOGIES:
+            nets = []
+            for seed in 1, 1, 2:
+                random.seed(seed)
+                nets.append(Network(9, 3, 2, self.nodet, self.nodea, topology, 'sync', 1, 0))
+            (a, b, c) = [net.adjacency for net in nets]
+            self.assertEqual(a, b)
+            for (t, sources) in enumerate(c):
+                self.assertFalse(t in sources)
+                self.assertEqual(len(set(sources)), len(sources))
+            if topology == 'nk':
+                self.assertNotEqual(a, c)
+            else:
+                self.assertTrue(a is c)
+
+    def summary(self, net):
+        "The state of net, with nodes replaced by their indices"
+        ref = lambda x: list(net).index(x)
+        s = [sorted([(k, v) for (k, v) in net.__dict__.items()
+                if k not in ('data', 'inputs', 'outputs')]),
+             map(ref, net.inputs), map(ref, net.outputs)]
+        for n in net:
+            # LogicalNode functions are persistent, so compare their tables
+            pars = [(k, hasattr(v, 'table') and v.table.tolist() or v) for (k, v) in n.par.__dict__.items()
+                if not k.startswith('_v_')]
+            s.append((type(n), sorted(pars), map(ref, n.inputs),
+                sorted([(k, v) for (k, v) in n.__dict__.items() if k not in ('inputs', 'par')])))
+        return s
+
+    def test_11_clone(self):
+        "clone gives the same copy as deepcopy"
+        for uniform in 0, 1:
+            a = Network(9, 3, 2, self.nodet, self.nodea, 'full', 'sync', 1, uniform)
+            for n in a.inputs:
+                n.addExternalInput(None, 'CONTACT', 1.0)
+            a.mutate(0.5)
+            c = a.clone()
+            self.assertEqual(self.summary(c), self.summary(copy.deepcopy(a)))
+            self.assertEqual(self.summary(c), self.summary(a))
+            self.assertEqual(len(set(a) & set(c)), 0)
+            self.assertEqual(uniform, c[0].par is c[1].par)
+
+    def test_12_instances(self):
+        "Phenotypes share parameters and weights with the genotype, but not changes"
+        g = Network(9, 3, 2, self.nodet, self.nodea, 'nk', 'sync', 2, 0)
+        (p, q) = (g.phenotype(), g.phenotype())
+        for (x, y, z) in zip(g, p, q):
+            self.assertTrue(x.par is y.par is z.par)
+            self.assertEqual([g.index(n) for n in x.inputs], [list(p).index(n) for n in y.inputs])
+            if hasattr(x, 'inputWeights'):
+                self.assertTrue(x.inputWeights is y.inputWeights is z.inputWeights)
+        if hasattr(g[0], 'inputWeights'):
+            w = g[0].inputWeights.tolist()
+            p[0].weights[p[0].inputs[0]] = 1.5
+            self.assertEqual(p[0].inputWeights[0], 1.5)
+            self.assertEqual(g[0].inputWeights.tolist(), w)
+            self.assertEqual(q[0].inputWeights.tolist(), w)
+
 class Sigmoid(NetworkTest,TestCase):
     nodet = SigmoidNode
 class Beer(NetworkTest,TestCase):
@@ -85,5 +184,49 @@ class Logical(NetworkTest,TestCase):
     nodet = LogicalNode
     nodea = {'quanta':2}
 
+class StepTest(TestCase):
+    "Network.dt is used by the continuous time models, not by those that count steps"
+
+    def pair(self, nodet, dt):
+        a = Network(9, 3, 2, nodet, {}, 'full', 'sync', 1, 0)
+        for n in a.inputs:
+            n.addExternalInput(None, 'CONTACT', 1.0)
+        b = copy.deepcopy(a)
+        b.dt = dt
+        return (a, b)
+
+    def test_0_steps(self):
+        "Sine and Srm outputs are per step whatever the step size"
+        for nodet in SineNode, SrmNode:
+            (a, b) = self.pair(nodet, 0.1)
+            step = lambda t: (a.stepNodes(), b.stepNodes())
+            outputs = lambda x: [n.output for n in x]
+            compareSteps(self, (a, b), step, outputs, 50)
+
+    def test_1_dt(self):
+        "Beer state integrates over dt"
+        (a, b) = self.pair(BeerNode, 0.1)
+        setExternalInputs(a, b)
+        a.stepNodes()
+        b.stepNodes()
+        self.assertNotEqual([n.state for n in a], [n.state for n in b])
+
+    def test_2_refractory(self):
+        "An If node refracts for par.tr steps whatever the step size"
+        for dt in DT, 0.1:
+            n = IfNode(1)
+            # charge to the threshold in a step, so it fires when it may
+            n.par.adaptRate = DT
+            n.addExternalInput(None, 'CONTACT', 16)
+            n.externalInputs[(None, 'CONTACT')] = 1.0
+            fired = []
+            for t in range(100):
+                n.preUpdate(dt)
+                n.postUpdate()
+                if n.output:
+                    fired.append(t)
+            gaps = [y - x for (x, y) in zip(fired, fired[1:])]
+            self.assertEqual(set(gaps), set([n.par.tr + 1]))
+
 if __name__ == "__main__":
     test_main()
@@ -1,8 +1,12 @@
 import logging
 import random
 import math
-from rand import rnd
+from rand import rnd, sample
+import transfer
+import validate
+import numpy
 from numpy import matrix
+from array import array
 
 from persistent import Persistent
 from persistent.list import PersistentList
@@ -11,6 +15,12 @@ from persistent.mapping import PersistentMapping
 log = logging.getLogger('node')
 log.setLevel(logging.WARN)
 
+# default Euler integration step size of the continuous time models, in
+# seconds. Networks pass their own to preUpdate, see Network.dt. The models
+# that count steps (Sine, If, Srm) ignore it; their times in seconds below
+# assume a step of DT.
+DT = 1.0 / 50
+
 def rdom((low,high), v=None, quanta=None):
     """random value from domain where existing value=v if rand.usegauss is set,
     or uniform otherwise. If quanta is set, quantise the returned value."""
@@ -37,11 +47,34 @@ def quantiseDomain((l,h), x, q):
         return x
     return round((float(x)-l)/(h-l)*(q-1))*(h-l)/(q-1)+l
 
+def srmEps(s):
+    "Spike response model postsynaptic potential, s steps after a spike"
+    return math.exp(-(s-2)/4)*(1-math.exp(-(s-2)/10))
+
+def srmEta(s):
+    "Spike response model refractory potential, s steps after a spike"
+    return -math.exp(-s/4)
+
 class Pars(Persistent):
     pass
 
+class NodeType(type):
+    """Metaclass of the node models. Runtime copies of nodes (see runtime())
+    count as instances of the model they were copied from, so isinstance tests
+    and calls to base class methods work for both."""
+
+    def __instancecheck__(cls, x):
+        t = type(x)
+        return issubclass(getattr(t, 'model', t), cls)
+
 class Node(Persistent):
 
+    __metaclass__ = NodeType
+    # attributes of this model, which are the slots of its runtime copies
+    attributes = ('inputs', 'externalInputs', 'par')
+    # inputs from this node use its eps potential rather than its output
+    epsOutput = 0
+
     def __init__(self, par):
         self.inputs = PersistentList() # list of internal inputs
         # externalInputs[(bp,sig)] = signalvalue
@@ -67,24 +100,18 @@ class Node(Persistent):
     def fixup(self):
         pass
 
-    def swapInputs(self, a, b):
-        "If we have any inputs from a or b swap them over (for mutate)"
-        log.debug('Node.swapInputs(%s,%s)', a, b)
-        log.debug('self.inputs=%s', self.inputs)
-        assert a != b
-
-        for i in range(len(self.inputs)):
-            if self.inputs[i] == a:
-                self.inputs[i] = b
-            elif self.inputs[i] == b:
-                self.inputs[i] = a
-
     def addInput(self, source):
         log.debug('addInput(source=%s, inputs=%s)', source, self.inputs)
         # make sure we have no connections from this source
         assert source not in self.inputs
         self.inputs.append(source)
 
+    def addInputs(self, sources):
+        "Add several inputs at once, see Network.connect"
+        assert len(set(sources)) == len(sources)
+        assert not set(sources) & set(self.inputs)
+        self.inputs.extend(sources)
+
     def delInput(self, source):
         # make sure we have one and only one connection from this source
         assert source in self.inputs
@@ -101,18 +128,77 @@ class Node(Persistent):
         log.debug('removeExternalInput(source=%s, externalInputs=%s)', (bp,sig), self.externalInputs)
         del self.externalInputs[(bp,sig)]
 
-    def preUpdate(self):
+    def preUpdate(self, dt=DT):
+        "dt is the Euler step size of the continuous time models"
         pass
 
+class Weights(object):
+    """The weights of a WeightNode by source, with the interface of the mapping
+    they used to be stored in. The node keeps them in arrays aligned with its
+    inputs and externalKeys lists, so a lookup is an index (found in
+    externalIndex for external inputs) and each node pickles to one small
+    record."""
+
+    def __init__(self, node):
+        self.node = node
+
+    def find(self, src):
+        "Return the name of the array holding the weight of src, and its index"
+        n = self.node
+        if src in n.externalIndex:
+            return ('externalWeights', n.externalIndex[src])
+        if src in n.inputs:
+            return ('inputWeights', n.inputs.index(src))
+        raise KeyError(src)
+
+    def __getitem__(self, src):
+        (a, i) = self.find(src)
+        return getattr(self.node, a)[i]
+
+    def __setitem__(self, src, w):
+        (a, i) = self.find(src)
+        # a new array, since runtime copies share them (see node.SHARED), and
+        # changes inside the array are invisible to persistence anyway
+        v = getattr(self.node, a)[:]
+        v[i] = w
+        setattr(self.node, a, v)
+
+    def __contains__(self, src):
+        return src in self.node.externalIndex or src in self.node.inputs
+
+    def __len__(self):
+        return len(self.node.inputs) + len(self.node.externalKeys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return list(self.node.inputs) + list(self.node.externalKeys)
+
+    def values(self):
+        return list(self.node.inputWeights) + list(self.node.externalWeights)
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
 class WeightNode(Node):
     'A traditional model neuron: state in [0,1], weighted inputs'
 
+    attributes = ('inputWeights', 'externalKeys', 'externalIndex',
+            'externalWeights', 'weightDomain', 'quanta', 'output', 'abs_weights')
+
     def __init__(self, par, weightDomain=(-7,7), quanta=None, abs_weights=0):
         # with absolute weights and polarity neurons range must be >= 0.
         if abs_weights:
             assert weightDomain[0] >= 0
         Node.__init__(self, par)
-        self.weights = PersistentMapping()
+        # weights of self.inputs, and of the external inputs in the order they
+        # were added, see Weights. externalIndex[key] is the index of an
+        # external input, and isn't stored.
+        self.inputWeights = array('d')
+        self.externalKeys = ()
+        self.externalIndex = {}
+        self.externalWeights = array('d')
         self.weightDomain = weightDomain
         self.quanta = quanta
         self.output = random.uniform(0,1)
@@ -120,21 +206,57 @@ class WeightNode(Node):
         # to be positive above
         self.abs_weights = abs_weights
 
+    def __getstate__(self):
+        state = dict(Persistent.__getstate__(self))
+        state.pop('externalIndex', None)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        # older runs stored the weights in a PersistentMapping keyed by
+        # source, see upgrade.py. Their wsum added the external inputs in
+        # the order of externalInputs, so that is the order they keep.
+        if 'weights' in state:
+            weights = state.pop('weights')
+            keys = tuple(state['externalInputs'].keys())
+            state['inputWeights'] = array('d', [weights[x] for x in state['inputs']])
+            state['externalKeys'] = keys
+            state['externalWeights'] = array('d', [weights[x] for x in keys])
+        keys = state.get('externalKeys', ())
+        state['externalIndex'] = dict(zip(keys, range(len(keys))))
+        Persistent.__setstate__(self, state)
+
+    def getWeights(self):
+        return Weights(self)
+
+    weights = property(getWeights)
+
     def destroy(self):
         Node.destroy(self)
-        del self.weights
+        del self.externalKeys
+        del self.externalIndex
 
     def mutate(self, p):
         mutations = 0
-        for src in self.weights.keys():
-            if random.random() < p:
-                mutations += 1
-                self.weights[src] = rdom(self.weightDomain, self.weights[src], self.quanta)
+        for a in 'inputWeights', 'externalWeights':
+            s = sample(len(getattr(self, a)), p)
+            if s:
+                # a new array, see Weights.__setitem__
+                v = getattr(self, a)[:]
+                for i in s:
+                    mutations += 1
+                    v[i] = rdom(self.weightDomain, v[i], self.quanta)
+                setattr(self, a, v)
         return mutations
 
     def addInput(self, source):
         Node.addInput(self, source)
-        self.weights[source] = rdom(self.weightDomain, None, self.quanta)
+        self.inputWeights = self.inputWeights + array('d', [rdom(self.weightDomain, None, self.quanta)])
+
+    def addInputs(self, sources):
+        Node.addInputs(self, sources)
+        w = [rdom(self.weightDomain, None, self.quanta) for _ in sources]
+        self.inputWeights = self.inputWeights + array('d', w)
 
     def addExternalInput(self, s_bp, s_sig, weight):
         'source = (srcBodypart, srcSignal, weight)'
@@ -144,69 +266,62 @@ class WeightNode(Node):
         Node.addExternalInput(self, source)
         if self.abs_weights:
             weight = abs(weight)
-        self.weights[source] = weight
+        # new objects, see Weights.__setitem__
+        index = dict(self.externalIndex)
+        index[source] = len(self.externalKeys)
+        self.externalIndex = index
+        self.externalKeys += (source,)
+        self.externalWeights = self.externalWeights + array('d', [weight])
 
     def removeExternalInput(self, bp, sig):
         'source = (srcBodypart, srcSignal)'
         Node.removeExternalInput(self, bp, sig)
-        del self.weights[(bp,sig)]
+        i = self.externalIndex[(bp,sig)]
+        self.externalKeys = self.externalKeys[:i] + self.externalKeys[i+1:]
+        self.externalIndex = dict(zip(self.externalKeys, range(len(self.externalKeys))))
+        self.externalWeights = self.externalWeights[:i] + self.externalWeights[i+1:]
 
     def delInput(self, source):
+        i = self.inputs.index(source)
         Node.delInput(self, source)
-        del self.weights[source]
+        self.inputWeights = self.inputWeights[:i] + self.inputWeights[i+1:]
 
     def check(self):
-        for key in self.weights.keys():
-            assert key in self.inputs
-        for src in self.inputs:
-            assert src in self.weights
-
-    def fixup(self):
-        # remove all weights that dont have an input
-        for weight_key in self.weights.keys():
-            if weight_key not in self.inputs:
-                del(self.weights[weight_key])
-        # add weight for any inputs that dont have one
-        for source in self.inputs:
-            if source not in self.weights:
-                weight = self._chooseRandom()
-                self.weights[source] = weight
-
-    def swapInputs(self, a, b):
-        Node.swapInputs(self, a, b)
-        if a in self.weights and b in self.weights:
-            t = self.weights[a]
-            self.weights[a] = self.weights[b]
-            self.weights[b] = t
-        elif a in self.weights:
-            self.weights[b] = self.weights[a]
-            del self.weights[a]
-        elif b in self.weights:
-            self.weights[a] = self.weights[b]
-            del self.weights[b]
+        # weights are swapped along with inputs, see Network.mutate
+        if not validate.on:
+            return
+        assert len(self.inputWeights) == len(self.inputs)
+        assert len(self.externalWeights) == len(self.externalKeys) == len(self.externalInputs)
+        for (i, key) in enumerate(self.externalKeys):
+            assert key in self.externalInputs
+            assert self.externalIndex[key] == i
 
     def wsum(self, inputs=None, use_external=1):
         'sum of weighted inputs'
         cumulative = 0
-        if inputs==None:
-            inputs = self.inputs
+        sources = zip(self.inputs, self.inputWeights)
+        if inputs != None:
+            # a subset of self.inputs, summed in the same order
+            inputs = set(inputs)
+            sources = [(src, w) for (src, w) in sources if src in inputs]
         # quantise inputs
-        for src in inputs:
+        for (src, w) in sources:
             x = src.output
             if self.quanta:
                 x = quantise(x, self.quanta)
-            if isinstance(src, SrmNode):
+            if src.epsOutput:
                 # hack since output is spikes, we want eps function
                 # note that we don't do quantisation here.
                 # note: with async nodes, eps may not have been set yet.
                 if hasattr(src, 'eps'):
                     x = src.eps
-            cumulative += x * self.weights[src]
+            cumulative += x * w
         if use_external:
-            for (src, x) in self.externalInputs.items():
+            for (src, w) in zip(self.externalKeys, self.externalWeights):
+                x = self.externalInputs[src]
                 if self.quanta:
                     x = quantise(x, self.quanta)
-                cumulative += x * self.weights[src]
+                cumulative += x * w
         return cumulative
 
 class SigmoidNode(WeightNode):
@@ -228,7 +343,11 @@ class SigmoidNode(WeightNode):
         self.output = rnd(0,1,self.output)
 
 class SineNode(WeightNode):
-    'Sine wave model'
+    """Sine wave model. The output only depends on the parameters and the
+    number of steps t since reset, so it is looked up in a table, see
+    getWave."""
+
+    attributes = ('state', 't')
 
     def __init__(self, par, weightDomain=(-7,7), quanta=None):
         WeightNode.__init__(self, par, weightDomain, quanta)
@@ -245,20 +364,38 @@ class SineNode(WeightNode):
         self.par.phaseOffset = rdom((0,2*math.pi), self.par.phaseOffset, self.quanta)
 
     def setStepSize(self):
-        # oscillate between [twice per second, once every 2 seconds)
+        # the phase advance per step, not scaled by dt. Oscillate between
+        # [twice per second, once every 2 seconds) at 1/DT steps per second.
         persec = math.pi*2/50
         self.par.stepSize = rdom((persec/2, persec*2), self.par.stepSize, self.quanta)
 
     def reset(self):
         self.state = self.par.phaseOffset
+        self.t = 0
 
     def setAmplitude(self):
         self.par.amplitude = rdom((0.25, 1), self.par.amplitude, self.quanta)
 
+    def getWave(self):
+        """The outputs and phases from reset, as a transfer.Sequence. It is
+        cached in par, so it is shared by uniform networks and the unrolled
+        copies of a bodypart, and rebuilt when the parameters change."""
+        par = self.par
+        key = (par.phaseOffset, par.stepSize, par.amplitude, self.quanta)
+        w = getattr(par, '_v_wave', None)
+        if not w or w.key != key:
+            (step, a, q) = key[1:]
+            def f(state):
+                return (quantise((math.sin(state)*a + 1) / 2, q), (state + step) % (2*math.pi))
+            w = transfer.Sequence(par.phaseOffset, f)
+            w.key = key
+            par._v_wave = w
+        return w
+
     def postUpdate(self):
         'return output in [0,1]'
-        self.output = quantise((math.sin(self.state)*self.par.amplitude + 1) / 2, self.quanta)
-        self.state = (self.state + self.par.stepSize) % (2*math.pi)
+        (self.output, self.state) = self.getWave().at(self.t)
+        self.t += 1
 
     def mutate(self, p):
         mutations = 0
@@ -276,6 +413,8 @@ class SineNode(WeightNode):
 class BeerNode(WeightNode):
     'Beer 1st order model'
 
+    attributes = ('state', 'nextState')
+
     def __init__(self, par, weightDomain=(-16,16), quanta=None, biasDomain=(-4,4)):
         WeightNode.__init__(self, par, weightDomain, quanta)
         if par == 1:
@@ -287,9 +426,8 @@ class BeerNode(WeightNode):
         self.state = None
         self.reset()
 
-    def preUpdate(self):
-        DT = 1.0 / 50
-        self.nextState = self.state + DT * (self.wsum() - self.state) / self.par.adaptRate
+    def preUpdate(self, dt=DT):
+        self.nextState = self.state + dt * (self.wsum() - self.state) / self.par.adaptRate
         # cap state to [-4,4]. This isn't part of the normal model but we need
         # clear boundaries for quantisation. +-4 is enough to define a clear
         # output range that almost gets to 0 and 1.
@@ -331,6 +469,8 @@ class BeerNode(WeightNode):
 class IfNode(BeerNode):
     'Integrate-and-fire spiking neuron model'
 
+    attributes = ('t',)
+
     def __init__(self, par, weightDomain=(-16,16), quanta=None, biasDomain=(1,4)):
         BeerNode.__init__(self, par, weightDomain, quanta, biasDomain)
         if par == 1:
@@ -338,7 +478,8 @@ class IfNode(BeerNode):
             self.setTr()
 
     def setTr(self):
-        self.par.tr = random.randint(5,25) # refract cycles (between 0 and 1/2 second)
+        # refract steps, not scaled by dt (between 0 and 1/2 second at DT)
+        self.par.tr = random.randint(5,25)
 
     def postUpdate(self):
         self.output = 0
@@ -367,6 +508,9 @@ class IfNode(BeerNode):
 class SrmNode(WeightNode):
     'Spike-response-model'
 
+    attributes = ('spikes', 'eps', 'eta', 'etamax', 'etamin', 'state')
+    epsOutput = 1
+
     def __init__(self, par, weightDomain=(-4,4), quanta=None):
         WeightNode.__init__(self, par, weightDomain, quanta)
         if par == 1:
@@ -380,20 +524,21 @@ class SrmNode(WeightNode):
     def reset(self):
         self.spikes = []
 
-    def preUpdate(self):
+    def preUpdate(self, dt=DT):
         # 20ms is too small since integration step is this big, so stretch
         # functions to 200ms.
         # we're counting in steps of 20ms upto 200ms, but we scale this to
-        # [0,20] for function calls to eps and eta.
+        # [0,20] for function calls to eps and eta. The history is 10 steps
+        # whatever dt is, so it is only 200ms at DT.
         self.spikes = [x+2 for x in self.spikes if x<20]
         self.eps = 0
         self.eta = 0
         for s in self.spikes:
             # we don't need to quantise values here because we could just use a
-            # precalculated 10 entry lookup table
+            # precalculated 10 entry lookup table (engine.SrmEngine does)
             if s >= 2: # synapse delay
-                self.eps += math.exp(-(s-2)/4)*(1-math.exp(-(s-2)/10))
-            self.eta += -math.exp(-s/4)
+                self.eps += srmEps(s)
+            self.eta += srmEta(s)
         self.eps = quantiseDomain((0,1.0), self.eps, self.quanta)
         self.eta = quantiseDomain((-1.1,0), self.eta, self.quanta)
 
@@ -420,6 +565,8 @@ class SrmNode(WeightNode):
 class TagaNode(WeightNode):
     'Taga 2nd order model'
 
+    attributes = ('u', 'v', 'next_u', 'next_v')
+
     def __init__(self, par, weightDomain=(-4,4), quanta=None):
         WeightNode.__init__(self, par, weightDomain, quanta)
         if par == 1:
@@ -437,10 +584,9 @@ class TagaNode(WeightNode):
     def setOutput(self):
         self.output = max(0, self.u)
 
-    def preUpdate(self):
-        DT = 1.0 / 50
-        self.next_u = self.u + DT * (-self.u - self.par.beta*max(0,self.v) + self.wsum() + self.par.b) / self.par.tau0
-        self.next_v = self.v + DT * (-self.v + self.output) / self.par.tau1
+    def preUpdate(self, dt=DT):
+        self.next_u = self.u + dt * (-self.u - self.par.beta*max(0,self.v) + self.wsum() + self.par.b) / self.par.tau0
+        self.next_v = self.v + dt * (-self.v + self.output) / self.par.tau1
 
         self.next_u = quantiseDomain((-1,1), self.next_u, self.quanta)
         self.next_v = quantiseDomain((0,1), self.next_v, self.quanta)
@@ -453,15 +599,19 @@ class TagaNode(WeightNode):
 class EkebergNode(WeightNode):
     'Ekeberg 3rd order model'
 
+    attributes = ('ye', 'yi', 'yt', 'next_ye', 'next_yi', 'next_yt', 'edom',
+            'idom', 'tdom')
+
+    # neuron type constants, shared by all neurons and selected by par.i
+    # i =   0      1      2     3
+    theta = [-0.2,   0.1,   0.5,  8.0  ]
+    r     = [ 1.8,   0.3,   1.0,  0.5  ]
+    tau_d = [ 0.03,  0.02,  0.02, 0.05 ]
+    mu    = [ 0.3,   0.0,   0.3,  0.0  ]
+    tau_a = [ 0.400, 0.001, 0.2,  0.001] # rm 0s: / by 0 in 3rd eq.
+
     def __init__(self, par, weightDomain=(0,16), quanta=None):
         WeightNode.__init__(self, par, weightDomain, quanta, 1)
-               # i =    0      1      2     3
-        self.theta = [-0.2,   0.1,   0.5,  8.0  ]
-        self.r     = [ 1.8,   0.3,   1.0,  0.5  ]
-        self.tau_d = [ 0.03,  0.02,  0.02, 0.05 ]
-        self.mu    = [ 0.3,   0.0,   0.3,  0.0  ]
-        self.tau_a = [ 0.400, 0.001, 0.2,  0.001] # rm 0s: / by 0 in 3rd eq.
-
         if par == 1:
             self.setI()
         self.par.excite = random.choice([True,False])
@@ -492,14 +642,13 @@ class EkebergNode(WeightNode):
         if self.quanta:
             self.output = quantise(self.output, self.quanta)
 
-    def preUpdate(self):
+    def preUpdate(self, dt=DT):
         excite_inputs = [x for x in self.inputs if x.par.excite]
         inhibit_inputs = [x for x in self.inputs if not x.par.excite]
         # here we are assuming that all sensory input is excitatory
-        DT = 1.0 / 50
-        self.next_ye = self.ye + DT * (-self.ye + self.wsum(excite_inputs)) / self.tau_d[self.par.i]
-        self.next_yi = self.yi + DT * (-self.yi + self.wsum(inhibit_inputs, 0)) / self.tau_d[self.par.i]
-        self.next_yt = self.yt + DT * (-self.yt + self.output)/self.tau_a[self.par.i]
+        self.next_ye = self.ye + dt * (-self.ye + self.wsum(excite_inputs)) / self.tau_d[self.par.i]
+        self.next_yi = self.yi + dt * (-self.yi + self.wsum(inhibit_inputs, 0)) / self.tau_d[self.par.i]
+        self.next_yt = self.yt + dt * (-self.yt + self.output)/self.tau_a[self.par.i]
         # restrict state to domain for quantisation
         # yt is (0,0.5) since (0,4) is too big for the decay, and due to direct
         # use of yt in output equation it has a large effect on output.
@@ -524,19 +673,40 @@ class EkebergNode(WeightNode):
             mutations += 1
         return mutations
 
-class MultiValueLogicFunction(PersistentList):
+class MultiValueLogicFunction(Persistent):
     """logical function of k inputs. outputs in the domain [low,high]
 
-    Used by Logical node."""
+    Used by Logical node. The table is a packed array of bytes, since it has
+    quanta**k entries."""
 
     def __init__(self, numberOfInputs, quanta):
         "Create a new random lookup table"
-        PersistentList.__init__(self)
+        assert quanta <= 256
         self.quanta = quanta
-        for _ in range(int(round(quanta ** numberOfInputs))):
-            self.append(self.getRandomValue())
+        n = int(round(quanta ** numberOfInputs))
+        self.table = numpy.array([self.getRandomValue() for _ in range(n)], numpy.uint8)
         log.debug('MultiValueLogicFunction created %d entries', len(self))
 
+    def __setstate__(self, state):
+        # older runs stored the table as a list of ints (this was a
+        # PersistentList), see upgrade.py
+        if 'data' in state:
+            state = dict(state)
+            state['table'] = numpy.array(state.pop('data'), numpy.uint8)
+        Persistent.__setstate__(self, state)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, i):
+        return int(self.table[i])
+
+    def __setitem__(self, i, v):
+        assert 0 <= v < self.quanta
+        self.table[i] = v
+        # changes inside the array are invisible to persistence
+        self._p_changed = True
+
     def getRandomValue(self):
         "Returns a random but valid value"
         randomValue = random.randint(0, self.quanta-1)
@@ -546,15 +716,16 @@ class MultiValueLogicFunction(PersistentList):
         "Change a value in the table"
         # find a random row in the table, replace output with new randint
         m = 0
-        for x in range(len(self)):
-            if random.random() < p:
-                self[x] = self.getRandomValue()
-                m += 1
+        for x in sample(len(self), p):
+            self[x] = self.getRandomValue()
+            m += 1
         return m
 
 class LogicalNode(Node):
     """Output is a logical function of k inputs."""
 
+    attributes = ('state', 'nextState', 'output')
+
     def __init__(self, par, numberOfInputs=None, quanta=None):
         "Either use a previously generated function table, or make a new one"
         Node.__init__(self, par)
@@ -573,23 +744,28 @@ class LogicalNode(Node):
     # genotype. So we keep the lookup table static but allow the bits to
     # overlap, so we'll end up with duplicate bits from the internal and
     # external inputs effectively XORed to partition the input space.
-    def preUpdate(self):
+    def preUpdate(self, dt=DT):
         "Convert inputs to a decimal value and lookup in logic function"
         x = 0
-        assert self.par.function.quanta**len(self.inputs) == len(self.par.function)
+        check = validate.on
+        if check:
+            assert self.par.function.quanta**len(self.inputs) == len(self.par.function)
         for i in range(len(self.inputs)):
             # we could just use the input neuron .state instead of .output
             # should get the same value, but without conversion
             v = int(round(self.inputs[i].output*(self.par.function.quanta-1)))
-            assert 0 <= v < self.par.function.quanta
+            if check:
+                assert 0 <= v < self.par.function.quanta
             x += self.par.function.quanta**i * v
-        assert isinstance(x, int)
-        assert x < len(self.par.function)
+        if check:
+            assert isinstance(x, int)
+            assert x < len(self.par.function)
         # consider external inputs
         # this will roll over the end of the lookup table
         for i in range(len(self.externalInputs)):
             v = self.externalInputs.values()[i]
-            assert 0 <= v <= 1
+            if check:
+                assert 0 <= v <= 1
             q = quantise(v, self.par.function.quanta)
             x += self.par.function.quanta**i * int(q*(self.par.function.quanta-1))
         x = x%len(self.par.function)
@@ -607,6 +783,81 @@ class LogicalNode(Node):
     def addExternalInput(self, bp, sig, w):
         Node.addExternalInput(self, (bp,sig))
 
+runtimeClasses = {}
+
+def newRuntime(model):
+    "Return an empty runtime copy of a model node"
+    return object.__new__(runtimeClass(model))
+
+def reduceRuntime(self):
+    "Pickle runtime copies by model and slots, since their classes are made here"
+    state = {}
+    for a in self.__slots__:
+        if hasattr(self, a):
+            state[a] = getattr(self, a)
+    return (newRuntime, (self.model,), (None, state))
+
+def runtimeClass(model):
+    """Return a class with the methods of node model, whose instances are plain
+    objects with __slots__ for the model attributes rather than persistent
+    objects with a __dict__."""
+    if model not in runtimeClasses:
+        d = {}
+        slots = []
+        for c in reversed(model.__mro__):
+            if c in (object, Persistent):
+                continue
+            d.update(c.__dict__)
+            slots += [a for a in c.__dict__.get('attributes', ()) if a not in slots]
+        # drop what only concerns the persistent model
+        for k in '__dict__', '__weakref__', '__metaclass__', '__slotnames__', '__setstate__':
+            d.pop(k, None)
+        d['__slots__'] = tuple(slots)
+        d['model'] = model
+        d['__reduce__'] = reduceRuntime
+        runtimeClasses[model] = type('Runtime' + model.__name__, (object,), d)
+    return runtimeClasses[model]
+
+# runtime copies share these with the original node rather than copying them.
+# They are only ever replaced, never changed in place (see Weights and
+# WeightNode.mutate), so the copies of a node can't see each other's changes.
+SHARED = ('par', 'inputWeights', 'externalKeys', 'externalIndex', 'externalWeights')
+
+def runtime(nodes, adjacency=None):
+    """Make runtime copies of nodes for simulation. Returns a dict that maps each
+    node to its copy. Inputs and weights are relinked to the copies, parameters
+    and weights are shared with the originals, and nothing is written back to
+    them. adjacency, if given, is the positions of the inputs of each node in
+    nodes (see Network.adjacency), which saves looking them up."""
+    m = {}
+    copies = []
+    for n in nodes:
+        c = newRuntime(type(n))
+        m[n] = c
+        copies.append(c)
+    for (t, n) in enumerate(nodes):
+        n._p_activate()
+        c = copies[t]
+        d = n.__dict__
+        for a in c.__slots__:
+            if a not in d:
+                continue
+            v = d[a]
+            if a in SHARED:
+                pass
+            elif a == 'inputs':
+                if adjacency:
+                    v = [copies[j] for j in adjacency[t]]
+                else:
+                    v = [m[x] for x in v]
+            elif a == 'externalInputs':
+                # the keys are (bodypart, signal), never nodes
+                v = dict(getattr(v, 'data', v))
+            elif isinstance(v, (list, array)):
+                v = v[:]
+            setattr(c, a, v)
+    return m
+
 class LqrController:
     def __init__(self, quanta=0):
         """Create LQR controller.
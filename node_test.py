@@ -7,12 +7,14 @@ import sys
 import os
 import re
 import math
+import numpy
+from persistent.mapping import PersistentMapping
 from Cheetah.Template import Template
 
 import test_common
 from test_common import *
 from network import Network, TOPOLOGIES
-from node import SigmoidNode, BeerNode, IfNode, SrmNode, TagaNode, EkebergNode, LogicalNode, SineNode, WeightNode
+from node import SigmoidNode, BeerNode, IfNode, SrmNode, TagaNode, EkebergNode, LogicalNode, SineNode, WeightNode, MultiValueLogicFunction
 from plot import plotNetwork
 
 class NodeTest:
@@ -152,6 +154,53 @@ class NodeTest:
 
 class Sigmoid(NodeTest,TestCase):
     nodet = SigmoidNode
+    def test_weights_upgrade(self):
+        "Weights stored in a mapping keyed by source are converted when loaded"
+        n0 = SigmoidNode(1)
+        n1 = SigmoidNode(1)
+        n0.addInput(n1)
+        n0.addExternalInput(None, 'CONTACT', 3.0)
+        state = n0.__getstate__()
+        state['weights'] = PersistentMapping({n1 : 2.0, (None, 'CONTACT') : 3.0})
+        for a in 'inputWeights', 'externalKeys', 'externalWeights':
+            del state[a]
+        n = SigmoidNode.__new__(SigmoidNode)
+        n.__setstate__(state)
+        self.assertEqual(n.weights[n1], 2.0)
+        self.assertEqual(n.weights[(None, 'CONTACT')], 3.0)
+        self.assertEqual(sorted(n.weights.values()), [2.0, 3.0])
+        n.check()
+        n.delInput(n1)
+        self.assertEqual(n.weights.items(), [((None, 'CONTACT'), 3.0)])
+    def test_weights_upgrade_wsum(self):
+        "A node loaded from a mapping of weights has the same weighted sum"
+        n0 = SigmoidNode(1)
+        n1 = SigmoidNode(1)
+        n1.output = 0.3
+        n0.addInput(n1)
+        weights = PersistentMapping({n1 : 1.5})
+        # magnitudes that make the sum depend on the order of addition
+        for i in range(20):
+            key = (None, 'S%d' % i)
+            n0.addExternalInput(None, key[1], 0)
+            n0.externalInputs[key] = 10.0**(i % 7) / 3
+            weights[key] = (-1)**i * (i + 0.1)
+        old = n1.output * weights[n1]
+        for (src, x) in n0.externalInputs.items():
+            old += x * weights[src]
+        state = n0.__getstate__()
+        self.assertFalse('externalIndex' in state)
+        state['weights'] = weights
+        for a in 'inputWeights', 'externalKeys', 'externalWeights':
+            del state[a]
+        n = SigmoidNode.__new__(SigmoidNode)
+        n.__setstate__(state)
+        n.check()
+        self.assertEqual(n.wsum(), old)
+        m = SigmoidNode.__new__(SigmoidNode)
+        m.__setstate__(n.__getstate__())
+        m.check()
+        self.assertEqual(m.wsum(), old)
 class Sine(NodeTest,TestCase):
     nodet = SineNode
 class Beer(NodeTest,TestCase):
@@ -177,5 +226,14 @@ class Ekeberg3(NodeTest,TestCase):
 class Logical(NodeTest,TestCase):
     nodet = LogicalNode
 
+    def test_function_upgrade(self):
+        "Tables stored as lists of ints are converted when loaded"
+        f = MultiValueLogicFunction.__new__(MultiValueLogicFunction)
+        f.__setstate__({'quanta' : 4, 'data' : [3, 0, 2, 1]})
+        self.assertEqual(list(f), [3, 0, 2, 1])
+        self.assertEqual(f.table.dtype, numpy.uint8)
+        f.mutate(1)
+        self.assertEqual(len(f), 4)
+
 if __name__ == "__main__":
     test_main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+"""Time copy.deepcopy against clone() for the genotypes that evolve copies.
+
+Run from the top directory, eg. python profiling/clone.py [repeats]"""
+
+import sys
+import os
+import time
+import copy
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+
+import bpg
+import node
+from network import Network
+
+def timeit(f, x, repeats):
+    "Seconds per call of f(x)"
+    t = time.time()
+    for _ in range(repeats):
+        f(x)
+    return (time.time() - t) / repeats
+
+def main():
+    repeats = 50
+    if len(sys.argv) > 1:
+        repeats = int(sys.argv[1])
+    random.seed(1)
+    network_args = { 'num_nodes' : 16,
+                     'num_inputs' : 3,
+                     'num_outputs' : 3,
+                     'new_node_class' : node.SigmoidNode,
+                     'new_node_args' : {},
+                     'topology' : 'full',
+                     'update_style' : 'sync',
+                     'radius' : 1,
+                     'uniform' : 0 }
+    g = bpg.BodyPartGraph(network_args)
+    for (name, x) in ('Network', Network(**network_args)), \
+                     ('BodyPart', g.root), \
+                     ('BodyPartGraph', g):
+        a = timeit(copy.deepcopy, x, repeats)
+        b = timeit(lambda x: x.clone(), x, repeats)
+        print '%-14s deepcopy %7.2fms  clone %7.2fms  %.1fx' % (name, a*1000, b*1000, a/b)
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,24 @@ def rnd(a, b, v):
     elif mut == 'uniform':
         return random.uniform(a, b)
 
+def sample(n, p):
+    """Indices in range(n) each chosen independently with probability p, in
+    increasing order. This is the same as testing random.random() < p for
+    each index, but the gaps between chosen indices are drawn from a
+    geometric distribution, so the cost is in the number chosen, not n."""
+    if n <= 0 or p <= 0:
+        return []
+    if p >= 1:
+        return range(n)
+    l = math.log1p(-p)
+    s = []
+    i = -1
+    while 1:
+        i += 1 + int(math.log(1 - random.random()) / l)
+        if i >= n:
+            return s
+        s.append(i)
+
 def randomVec3(ov):
     "Create a random normalised vector"
     try:
@@ -0,0 +1,43 @@
+#!/usr/bin/python
+
+from unittest import TestCase
+import random
+
+from test_common import *
+from rand import sample
+
+random.seed(5)
+
+class SampleTest(TestCase):
+
+    def test_0_limits(self):
+        self.assertEqual(sample(10, 0), [])
+        self.assertEqual(sample(10, 1), range(10))
+        self.assertEqual(sample(0, 0.5), [])
+
+    def test_1_order(self):
+        "Indices are distinct, increasing and in range"
+        for p in 0.01, 0.3, 0.9:
+            for _ in range(200):
+                s = sample(50, p)
+                self.assertEqual(s, sorted(set(s)))
+                self.assertTrue(not s or 0 <= s[0] and s[-1] < 50)
+
+    def test_2_distribution(self):
+        "Each index is chosen with probability p, independently of the others"
+        (n, p, trials) = (20, 0.1, 20000)
+        hits = [0] * n
+        counts = [0] * (n+1)
+        for _ in range(trials):
+            s = sample(n, p)
+            counts[len(s)] += 1
+            for i in s:
+                hits[i] += 1
+        # binomial sd of each count is 42
+        for h in hits:
+            self.assertTrue(abs(h - trials*p) < 200)
+        # P(no mutations) = 0.9**20
+        self.assertTrue(abs(counts[0] - trials * (1-p)**n) < 250)
+
+if __name__ == "__main__":
+    test_main()
@@ -11,6 +11,7 @@ from numpy import matrix
 import bpg
 import node
 import network
+import validate
 
 CYLINDER_RADIUS = 0.5
 CYLINDER_DENSITY = 5
@@ -98,13 +99,16 @@ class Motor(ode.AMotor):
                     log.debug('joint maxf now %f', f)
 
         # enforce axes angle limits
+        check = validate.on
         for x in self.axes:
-            assert -math.pi <= self.dangle[x] <= math.pi
+            if check:
+                assert -math.pi <= self.dangle[x] <= math.pi
             l = {0: math.pi, 1: math.pi/2, 2: math.pi}[x]
             self.dangle[x] = min(self.dangle[x], l)
             self.dangle[x] = max(self.dangle[x], -l)
             a = self.getAngle(x)
-            assert -math.pi <= a <= math.pi
+            if check:
+                assert -math.pi <= a <= math.pi
             # check for 360 degree rotation / violation of stops
             if -math.pi < self.lastangle[x] < -math.pi/2 and math.pi/2 < a < math.pi or math.pi/2 < self.lastangle[x] < math.pi and -math.pi < a < -math.pi/2:
                 lostops = [ode.ParamLoStop,ode.ParamLoStop2,ode.ParamLoStop3]
@@ -130,7 +134,7 @@ class Motor(ode.AMotor):
             s = '%s %s %s %s %s %s\n'%(a[0], d[0], a[1], d[1], a[2], d[2])
         if self.f:
             self.f.write('%2.2f '%self.t + s)
-            self.t += 0.02
+            self.t += DT
         log.debug('Motor angles=%s desired_angles=%s', ['%1.2f'%self.getAngle(x) for x in 0,1,2], ['%1.2f'%x for x in self.dangle])
 
         # use error to calculate velocity for ODE internal motor model
@@ -180,6 +184,8 @@ class Sim(object):
         assert type(max_simsecs) is float or type(max_simsecs) is int
         self.quick = quick
         self.total_time = 0.0
+        # number of physics steps since relaxing
+        self.ticks = 0
         self.relax_time = 0
         self.max_simsecs = float(max_simsecs)
         self.world = ode.World()
@@ -260,6 +266,7 @@ class Sim(object):
         self.worldStep()
         self.contactGroup.empty()
         self.total_time += DT
+        self.ticks += 1
         log.debug('stepped world by %f time is %f', DT, self.total_time)
         # check for sim blowing up
         for g in self.space:
@@ -279,9 +286,19 @@ class Sim(object):
 class BpgSim(Sim):
     "Simulate articulated bodies built from BodyPartGraphs"
 
-    def __init__(self, max_simsecs=30.0, fitnessName='meandistance', noise_sd=0.01, quick=0):
+    def __init__(self, max_simsecs=30.0, fitnessName='meandistance', noise_sd=0.01, quick=0, control_hz=HZ):
+        """control_hz is the rate at which sensors are read and the networks
+        are stepped. It divides HZ, and the physics and motors still run at
+        HZ in between. The continuous time node models integrate over the
+        control period, but the Sine, If and Srm models count control steps,
+        so below HZ they run slower in simulated time, see Network.dt."""
         Sim.__init__(self, max_simsecs, noise_sd, quick)
         log.debug('BPGSim.__init__')
+        assert HZ % control_hz == 0
+        self.decimation = HZ / control_hz
+        # the continuous time node models integrate over the control period,
+        # see Network.dt
+        self.dt = 1.0 / control_hz
         self.geom_contact = {}
         self.startpos = vec3(0, 0, 0)
         self.relaxed = 0
@@ -304,6 +321,12 @@ class BpgSim(Sim):
         # for some reason this instance method keeps a pointer to the sim object
         del self.fitnessMethod
 
+    def run(self):
+        Sim.run(self)
+        # count the transition cache hits now, see engine.reportMemo
+        for bg in self.bpgs:
+            bg.dropEngine()
+
     def getMaxSimTime(self):
         """max_simsecs attribute. add relax time to the sim time when set.
             return the real full sim time so that it can be rendered correctly."""
@@ -320,6 +343,11 @@ class BpgSim(Sim):
     def initSignalLog(self, fname):
         self.siglog = open(fname, 'w')
         assert self.bpgs
+        # every node is logged, so step them all
+        for bg in self.bpgs:
+            for bp in bg.bodyparts:
+                bp.network.prune()
+            bg.dropEngine()
         s = '# time  '
         self.signals = []
         def pad(x):
@@ -545,7 +573,12 @@ class BpgSim(Sim):
         self.raiseGeoms()
         # initialise the networks into random state
         for bp in bpgraph.bodyparts:
+            bp.network.dt = self.dt
             bp.network.reset()
+        # only step the nodes that can affect the motors
+        (stepped, total) = bpgraph.prune()
+        self.pruned = (total - stepped, total)
+        log.debug('pruned %d of %d nodes', total - stepped, total)
         self.bpgs.append(bpgraph)
 
     def raiseGeoms(self):
@@ -800,7 +833,8 @@ class BpgSim(Sim):
             # network output node, in domain [0,1]
             value = src.output
 
-        assert 0 <= value <= 1
+        if validate.on:
+            assert 0 <= value <= 1
 
         # gaussian noise on sensors and motors
         noisyValue = random.gauss(value, self.noise_sd)
@@ -818,7 +852,10 @@ class BpgSim(Sim):
             of every Network.
 
           * Go through all BodyParts, for each motor, find connected
-            OutputNode (if any) and get value."""
+            OutputNode (if any) and get value.
+
+        The first two, and setting the motor targets, are only done every
+        decimation steps. The motors servo to their targets every step."""
 
         if not self.relaxed:
             e = self.relax()
@@ -828,9 +865,16 @@ class BpgSim(Sim):
 
         self.logSignals()
 
+        if self.ticks % self.decimation:
+            for bg in self.bpgs:
+                bg.stepMotors()
+            Sim.step(self)
+            return
+
         for g in self.geom_contact:
             self.geom_contact[g] = 0 # reset contact sensors
 
+        check = validate.on
         # update sensor input values
         for bg in self.bpgs:
             for bp in bg.bodyparts:
@@ -846,10 +890,12 @@ class BpgSim(Sim):
                     for mi in motors:
                         (sbp, src, weight) = bp.motor_input[mi]
                         v = self.getSensorValue(sbp, src)
-                        assert 0 <= v <= 1
-                        assert -7 <= weight <= 7
+                        if check:
+                            assert 0 <= v <= 1
+                            assert -7 <= weight <= 7
                         v = ((v-0.5)*2*abs(weight)/7)*math.pi # map to -pi..pi
-                        assert -math.pi <= v <= math.pi
+                        if check:
+                            assert -math.pi <= v <= math.pi
                         bp.motor.dangle[mi] = v
 
                 # now do inputs to network
@@ -942,8 +988,10 @@ class PoleBalanceSim(Sim):
         self.setNetwork(net)
 
     def setNetwork(self, net):
+        """Simulate a phenotype of net. Nothing is written back to net, so it
+        can be shared with the evolving population."""
         assert type(net) is network.Network
-        self.network = net
+        self.network = net.phenotype()
         self.network.reset()
         self.finished = 0
         # fake external_input connection so node knows its an input
@@ -1034,10 +1082,7 @@ class PoleBalanceSim(Sim):
     def run(self):
         Sim.run(self)
         if self.network:
-            # hack, setNetwork adds an external input, so we remove it here so
-            # that the memory can be freed
-            for x in range(4):
-                self.network.inputs[0].removeExternalInput(self.sig[x][0], self.sig[x][1])
+            self.network.dropEngine()
 
     def initSignalLog(self, fname):
         self.siglog = open(fname, 'w')
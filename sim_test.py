@@ -140,6 +140,25 @@ class BpgTestCase(unittest.TestCase):
         s.run()
         assert s.score == -1 or s.score >= 0
 
+    def test_8_control_hz(self):
+        "Networks are stepped at the control rate, the physics at HZ"
+        b = TestBodyPartGraph(new_network_args, 3, 'hinge')
+        s = sim.BpgSim(SECONDS, control_hz=10)
+        s.add(b)
+        s.relaxed = 1
+        bg = s.bpgs[0]
+        steps = []
+        step = bg.step
+        bg.step = lambda: steps.append(s.ticks) or step()
+        for _ in range(20):
+            s.step()
+        self.assertEqual(steps, [0, 5, 10, 15])
+        self.assertAlmostEqual(s.total_time, 20*sim.DT)
+        for bp in bg.bodyparts:
+            self.assertEqual(bp.network.dt, 0.1)
+        # nothing outside the sim changes
+        self.assertEqual(node.DT, sim.DT)
+
 def runVisualSim(sim, record=0, avifile=None):
     "Open the QT renderer and run the simulation"
     myapp.setRecord(record, avifile)
@@ -1,10 +1,12 @@
 import sys
 import os
 import logging
+import random
 import testoob
 import node
 import bpg
 import sim
+import validate
 
 def setup_logging():
     rootlogger = logging.getLogger()
@@ -39,6 +41,30 @@ new_sim_args = { 'max_simsecs' : 10,
 
 interactive = 0
 
+def externalKeys(n):
+    "Keys of the external inputs of node n, in a fixed order"
+    # LogicalNode has no weights, so it doesn't keep the keys in a list
+    return getattr(n, 'externalKeys', None) or sorted(n.externalInputs)
+
+def setExternalInputs(*nets):
+    """Set random external input values, as the simulator does. The nodes of
+    each of nets (sequences of nodes) are paired by position, and each pair
+    gets the same values."""
+    for ns in zip(*nets):
+        for ks in zip(*[externalKeys(n) for n in ns]):
+            v = random.random()
+            for (n, k) in zip(ns, ks):
+                n.externalInputs[k] = v
+
+def compareSteps(test, (a, b), step, values, steps, nodes=list):
+    """Step a and b from the same external inputs, and check that they stay
+    the same. step(t) steps both at step t, values(x) is what is compared of
+    x, and nodes(x) is the nodes of x."""
+    for t in range(steps):
+        setExternalInputs(nodes(a), nodes(b))
+        step(t)
+        test.assertEqual(values(a), values(b))
+
 def test_main():
     if not os.path.exists('test'):
         os.mkdir('test')
@@ -46,6 +72,18 @@ def test_main():
         global interactive
         interactive = 1
         sys.argv.remove('-i')
+    # --validate x and --vfraction x, as for ev
+    level = validate.level
+    fraction = None
+    if '--validate' in sys.argv:
+        i = sys.argv.index('--validate')
+        level = sys.argv[i+1]
+        del sys.argv[i:i+2]
+    if '--vfraction' in sys.argv:
+        i = sys.argv.index('--vfraction')
+        fraction = float(sys.argv[i+1])
+        del sys.argv[i:i+2]
+    validate.setLevel(level, fraction)
     setup_logging()
     logging.getLogger('ZEO').setLevel(logging.WARNING)
     testoob.main()
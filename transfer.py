@@ -0,0 +1,92 @@
+"""transfer.py - precomputed transfer functions for the node models.
+
+The engines (see engine.py) look up the quantised sigmoid outputs of
+SigmoidNode and BeerNode networks in a LevelTable: the inputs at which the
+output steps up a level, so a vector of outputs is one searchsorted with no
+exp and no quantise. The thresholds are where the arithmetic of the node
+models changes level, so the lookups are exact. The node models themselves
+step one value at a time, where the formula is cheaper than a python lookup.
+SineNode ignores its inputs, so its outputs are a Sequence, tabulated once
+per set of parameters."""
+
+import bisect
+import math
+
+import numpy
+
+tables = {}
+
+class LevelTable(object):
+    """A monotonic increasing function quantised to quanta levels in [0,1].
+    thresholds[k-1] is the lowest input with output level k."""
+
+    def __init__(self, f, inverse, quanta):
+        """f is the function as the node models compute it, and inverse its
+        inverse for arrays. The thresholds are moved from the inverse to the
+        float where round((quanta-1)*f(x)) changes."""
+        self.quanta = quanta
+        p = (numpy.arange(1, quanta) - 0.5) / (quanta-1)
+        level = lambda x: round((quanta-1)*f(x))
+        t = []
+        for (k, x) in enumerate(inverse(p).tolist()):
+            # bisect between lo below level k+1 and hi at or above it
+            d = 1e-9
+            while level(x - d) >= k+1 or level(x + d) < k+1:
+                d *= 2
+            (lo, hi) = (x - d, x + d)
+            while 1:
+                mid = (lo + hi) / 2
+                if mid in (lo, hi):
+                    break
+                if level(mid) < k+1:
+                    lo = mid
+                else:
+                    hi = mid
+            t.append(hi)
+        self.thresholds = numpy.array(t)
+        self.t = t
+
+    def __call__(self, x):
+        "Quantised value of the function at x"
+        return bisect.bisect_right(self.t, x) / (self.quanta-1.0)
+
+    def levels(self, x):
+        "Output levels for an array of inputs"
+        return numpy.searchsorted(self.thresholds, x, 'right')
+
+    def vector(self, x):
+        "Quantised values for an array of inputs"
+        return self.levels(x) / (self.quanta-1.0)
+
+class Sequence(object):
+    """Outputs of a model that ignores its inputs, such as SineNode, at each
+    step after a reset. f(state) returns (output, next state). The outputs are
+    tabulated as they are needed, so nodes with the same parameters step
+    through one table."""
+
+    def __init__(self, state, f):
+        self.f = f
+        self.states = [state]
+        self.outputs = []
+
+    def extend(self, steps):
+        "Tabulate at least steps outputs, doubling the table to amortise calls"
+        s = self.states[-1]
+        for _ in range(max(steps, 2*len(self.outputs), 64) - len(self.outputs)):
+            (y, s) = self.f(s)
+            self.outputs.append(y)
+            self.states.append(s)
+
+    def at(self, t):
+        "(output at step t, state after it)"
+        if t >= len(self.outputs):
+            self.extend(t+1)
+        return (self.outputs[t], self.states[t+1])
+
+def sigmoid(quanta):
+    "Table of the quantised 1/(1+e**-x), for SigmoidNode and BeerNode outputs"
+    key = ('sigmoid', quanta)
+    if key not in tables:
+        f = lambda x: 1/(1 + math.e**-x)
+        tables[key] = LevelTable(f, lambda p: numpy.log(p / (1-p)), quanta)
+    return tables[key]
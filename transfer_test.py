@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+from unittest import TestCase
+import math
+import random
+
+import numpy
+
+from test_common import *
+import transfer
+from node import SineNode, quantise
+
+random.seed(3)
+
+class SigmoidTest(TestCase):
+
+    def f(self, x):
+        return 1/(1 + math.e**-x)
+
+    def test_0_vector(self):
+        "Array lookups are the same as scalar ones"
+        for quanta in 2, 8, 64:
+            t = transfer.sigmoid(quanta)
+            x = numpy.random.uniform(-20, 20, 1000)
+            x[:5] = t.t[:5]
+            self.assertEqual(t.vector(x).tolist(), [t(v) for v in x.tolist()])
+
+    def test_1_levels(self):
+        "Quantised sigmoid is exactly the node formula, also at level boundaries"
+        for quanta in 2, 3, 4, 8, 16, 32, 64:
+            t = transfer.sigmoid(quanta)
+            xs = [random.uniform(-8, 8) for _ in range(2000)]
+            for b in t.t:
+                xs += [b, float(numpy.nextafter(b, -numpy.inf)), float(numpy.nextafter(b, numpy.inf))]
+            for x in xs:
+                self.assertEqual(t(x), quantise(self.f(x), quanta))
+
+class SineTest(TestCase):
+
+    def test_0_steps(self):
+        "Tabulated SineNode outputs are exactly those of stepping the phase"
+        for quanta in None, 2, 8:
+            n = SineNode(par=1, quanta=quanta)
+            n.reset()
+            state = n.par.phaseOffset
+            for _ in range(500):
+                y = quantise((math.sin(state)*n.par.amplitude + 1) / 2, quanta)
+                state = (state + n.par.stepSize) % (2*math.pi)
+                n.postUpdate()
+                self.assertEqual((n.output, n.state), (y, state))
+
+    def test_1_shared(self):
+        "Nodes with the same parameters share a table, which follows changes"
+        n = SineNode(par=1)
+        m = SineNode(par=n.par)
+        self.assertTrue(n.getWave() is m.getWave())
+        w = n.getWave()
+        n.par.amplitude = 0.5
+        self.assertTrue(n.getWave() is not w)
+        self.assertEqual(n.getWave().at(0)[0], (math.sin(n.par.phaseOffset)*0.5 + 1) / 2)
+
+if __name__ == "__main__":
+    test_main()
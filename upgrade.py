@@ -0,0 +1,53 @@
+#!/usr/bin/python
+
+"""Convert the runs in a database to the current storage format.
+
+MultiValueLogicFunction tables used to be lists of ints, and WeightNode
+weights used to be PersistentMappings keyed by source. They are converted to
+arrays when they are loaded, but that is only saved once they are written
+back. This marks every table and weighted node in every run as changed so
+that the whole database is rewritten in the new format; pack it afterwards
+(see pack.py) to reclaim the space.
+
+usage: upgrade.py [-z server] [-f file] [run...]"""
+
+import sys
+import getopt
+import transaction
+
+import db
+from node import LogicalNode, WeightNode
+
+def networks(x):
+    "Return the networks of an individual"
+    if hasattr(x, 'bodyparts'):
+        return [bp.network for bp in x.bodyparts]
+    return [x]
+
+def upgrade(g):
+    """Rewrite the lookup tables and weighted nodes of run g, return the number
+    rewritten"""
+    done = set()
+    for x in g:
+        for net in networks(x):
+            for n in net:
+                if isinstance(n, LogicalNode) and id(n.par.function) not in done:
+                    n.par.function._p_changed = True
+                    done.add(id(n.par.function))
+                elif isinstance(n, WeightNode):
+                    n._p_changed = True
+                    done.add(id(n))
+    return len(done)
+
+def main():
+    opts, args = getopt.getopt(sys.argv[1:], 'z:f:')
+    opts = dict(opts)
+    root = db.connect(server=opts.get('-z'), zodb=opts.get('-f'))
+    for r in args or root.keys():
+        print 'upgrading', r,
+        print upgrade(root[r]), 'objects'
+        transaction.commit()
+    db.close()
+
+if __name__ == '__main__':
+    main()
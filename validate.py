@@ -0,0 +1,40 @@
+"""validate.py - how much invariant checking to do.
+
+Network.check, WeightNode.check, BodyPartGraph.sanityCheck and the asserts in
+BpgSim.step and LogicalNode.preUpdate can cost more than the work they check.
+level is one of:
+
+ off      skip the checks
+ sampled  check a random fraction of mutations and evaluations
+ full     check everything
+
+Generation calls select() at the start of each mutation and evaluation, and
+the checks test on."""
+
+import random
+
+LEVELS = ('off', 'sampled', 'full')
+
+level = 'full'
+fraction = 0.1
+# whether the current mutation or evaluation is checked
+on = 1
+# sampling has its own generator so that it doesn't change the evolution
+rng = random.Random()
+
+def setLevel(l, f=None):
+    "Set the validation level, and for sampled, the fraction checked"
+    global level, fraction, on
+    assert l in LEVELS
+    level = l
+    if f != None:
+        assert 0 <= f <= 1
+        fraction = f
+    on = int(level != 'off')
+
+def select():
+    "Decide whether to check the next mutation or evaluation"
+    global on
+    if level == 'sampled':
+        on = int(rng.random() < fraction)
+    return on
@@ -0,0 +1,58 @@
+#!/usr/bin/python
+
+from unittest import TestCase
+import random
+
+from test_common import *
+import validate
+from network import Network
+from node import SigmoidNode, LogicalNode
+
+class ValidateTest(TestCase):
+
+    def setUp(self):
+        self.level = (validate.level, validate.fraction)
+
+    def tearDown(self):
+        validate.setLevel(*self.level)
+
+    def broken(self):
+        "A network whose first node has lost a weight"
+        net = Network(5, 2, 2, SigmoidNode, {}, 'full', 'sync', 1, 0)
+        net[0].inputWeights = net[0].inputWeights[1:]
+        return net
+
+    def test_0_full(self):
+        validate.setLevel('full')
+        self.assertEqual(validate.select(), 1)
+        self.assertRaises(AssertionError, self.broken().check)
+
+    def test_1_off(self):
+        validate.setLevel('off')
+        self.assertEqual(validate.select(), 0)
+        self.broken().check()
+
+    def test_2_sampled(self):
+        "Sampling checks about fraction of the time, without using random"
+        validate.setLevel('sampled', 0.25)
+        random.seed(1)
+        r = random.random()
+        random.seed(1)
+        n = 0
+        for _ in range(4000):
+            n += validate.select()
+        self.assertTrue(800 < n < 1200)
+        self.assertEqual(random.random(), r)
+
+    def test_3_engine(self):
+        "The logical engine only checks its external inputs when validating"
+        net = Network(5, 2, 2, LogicalNode, {'quanta':2}, 'full', 'sync', 1, 0)
+        net.inputs[0].addExternalInput(None, 'JOINT_0', None)
+        net.inputs[0].externalInputs[(None, 'JOINT_0')] = 2
+        validate.setLevel('full')
+        self.assertRaises(AssertionError, net.step)
+        validate.setLevel('off')
+        net.step()
+
+if __name__ == "__main__":
+    test_main()